@@ -0,0 +1,80 @@
+"""Сжатие ответов и условные GET для JSON API.
+
+CompressionMiddleware сжимает ответы brotli (если установлен пакет brotli и
+клиент его принимает) или gzip. Ответы, у которых уже есть Content-Encoding
+(страницы из pages.py сжаты заранее), не трогаются.
+
+Списки решений и заданий получают weak ETag, вычисленный по сводке таблицы
+(количество строк, максимальные id и время изменения) - запрос сводки намного
+дешевле самого списка. Если у клиента та же версия, возвращается 304 без тела.
+"""
+import hashlib
+import os
+from fastapi import Request, Response
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("VERICODE_COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("VERICODE_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("VERICODE_BROTLI_QUALITY", 5))
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        data = self._compressor.process(body)
+        return data + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.brotli_quality = brotli_quality
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and brotli is not None:
+            accept_encoding = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+            if "br" in {item.split(";")[0].strip() for item in accept_encoding.split(",")}:
+                responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+                await responder(scope, receive, send)
+                return
+        await self.gzip(scope, receive, send)
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def not_modified(request: Request, response: Response, *parts):
+    """Ставит ответу weak ETag по parts; если клиент прислал тот же ETag, возвращает ответ 304.
+
+    parts должны включать все, от чего зависит ответ: пользователя, параметры запроса
+    и сводку данных (crud.solutions_version, crud.assignments_version).
+    """
+    etag = weak_etag(request.url.path, str(request.query_params), *parts)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    # Сравнение слабое: W/"x" и "x" совпадают
+    client_tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag.removeprefix("W/") in client_tags or "*" in client_tags:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
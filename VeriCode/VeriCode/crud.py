@@ -1,22 +1,32 @@
-from sqlalchemy.orm import Session
+import base64
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import and_, or_, select, DateTime, String, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.sql import func
 import models, schemas
-from passlib.hash import bcrypt
+import passwords
+from plagiarism import fingerprint, normalize_ast, encode_fingerprint, FINGERPRINT_VERSION
+
+logger = logging.getLogger(__name__)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля"""
-    return bcrypt.verify(plain_password, hashed_password)
+    """Проверка пароля (в пуле паролей, блокирует вызывающий поток)"""
+    return passwords.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Хеширование пароля"""
-    return bcrypt.hash(password)
+    """Хеширование пароля (в пуле паролей, блокирует вызывающий поток)"""
+    return passwords.hash_password(password)
 
 # --------- Пользователи ---------
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = bcrypt.hash(user.password)
+    hashed_password = get_password_hash(user.password)
     # Учителя создаются неодобренными, остальные - одобренными
     is_approved = user.role != "teacher"
     db_user = models.User(
@@ -32,12 +42,32 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+def get_existing_usernames(db: Session, usernames) -> set:
+    return {row.username for row in db.query(models.User.username).filter(models.User.username.in_(set(usernames)))}
+
+def insert_users(db: Session, rows: list) -> dict:
+    """Вставляет пользователей одним executemany (без commit). rows - словари со столбцами
+    users, пароль уже захеширован. Возвращает {username: id}."""
+    if not rows:
+        return {}
+    db.execute(models.User.__table__.insert(), rows)
+    return {row.username: row.id for row in db.query(models.User.id, models.User.username).filter(
+        models.User.username.in_([row["username"] for row in rows])
+    )}
+
+def get_existing_group_ids(db: Session, group_ids) -> set:
+    return {row.id for row in db.query(models.Group.id).filter(models.Group.id.in_(set(group_ids)))}
+
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
-    if not user or not bcrypt.verify(password, user.password):
+    if not user or not verify_password(password, user.password):
         return None
     return user
 
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user_id).update({models.User.password: hashed_password})
+    db.commit()
+
 # --------- Группы ---------
 def create_group(db: Session, group: schemas.GroupCreate, teacher_id: int):
     db_group = models.Group(
@@ -50,39 +80,93 @@ def create_group(db: Session, group: schemas.GroupCreate, teacher_id: int):
     db.refresh(db_group)
     return db_group
 
+def group_member_count():
+    """Число участников группы - COUNT-подзапрос по user_groups вместо загрузки group.members"""
+    return select(func.count()).where(
+        models.user_group_association.c.group_id == models.Group.id
+    ).correlate(models.Group).scalar_subquery().label("member_count")
+
 def get_teacher_groups(db: Session, teacher_id: int):
+    """Группы учителя: строки (Group, member_count)"""
     try:
-        groups = db.query(models.Group).filter(models.Group.teacher_id == teacher_id).all()
-        print(f"Найдено {len(groups)} групп для учителя {teacher_id}")
+        groups = db.query(models.Group, group_member_count()).filter(models.Group.teacher_id == teacher_id).all()
+        logger.debug("Найдено %d групп для учителя %s", len(groups), teacher_id)
         return groups
-    except Exception as e:
-        print(f"Ошибка получения групп для учителя {teacher_id}: {str(e)}")
+    except Exception:
+        logger.exception("Ошибка получения групп для учителя %s", teacher_id)
         return []
 
 def get_user_groups(db: Session, user_id: int):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    return user.groups if user else []
-
-def get_all_groups(db: Session):
-    return db.query(models.Group).all()
-
-def add_user_to_group(db: Session, user_id: int, group_id: int, teacher_id: int):
+    """Группы студента с учителем: строки (Group, member_count)"""
+    return db.query(models.Group, group_member_count()).options(joinedload(models.Group.teacher)).join(
+        models.user_group_association, models.user_group_association.c.group_id == models.Group.id
+    ).filter(models.user_group_association.c.user_id == user_id).all()
+
+def get_user_group_ids(db: Session, user_id: int) -> set:
+    return {row.group_id for row in db.query(models.user_group_association.c.group_id).filter(
+        models.user_group_association.c.user_id == user_id
+    )}
+
+def get_all_groups(db: Session, cursor: str = None, limit: int = None, name: str = None,
+                   exclude_member_id: int = None):
+    """Страница групп по возрастанию id с учителем: (строки (Group, member_count), курсор следующей страницы)"""
+    query = db.query(models.Group, group_member_count()).options(joinedload(models.Group.teacher))
+    if name:
+        query = query.filter(prefix_filter(models.Group.name, name))
+    if exclude_member_id is not None:
+        query = query.filter(~models.Group.members.any(models.User.id == exclude_member_id))
+    return paginate(query, [models.Group.id], lambda row: [row.Group.id], cursor, limit, descending=False)
+
+MEMBERSHIP_BATCH_SIZE = 500
+
+def insert_group_memberships(db: Session, pairs) -> int:
+    """Добавляет пары (user_id, group_id) в user_groups, пропуская существующие (без commit).
+    Один INSERT ... ON CONFLICT DO NOTHING на пакет; возвращает число добавленных строк."""
+    table = models.user_group_association
+    values = [{"user_id": user_id, "group_id": group_id} for user_id, group_id in sorted(set(pairs))]
+    dialect = db.get_bind().dialect.name
+    added = 0
+    for start in range(0, len(values), MEMBERSHIP_BATCH_SIZE):
+        batch = values[start:start + MEMBERSHIP_BATCH_SIZE]
+        if dialect == "sqlite":
+            statement = sqlite.insert(table).values(batch).on_conflict_do_nothing()
+        elif dialect == "postgresql":
+            statement = postgresql.insert(table).values(batch).on_conflict_do_nothing()
+        else:
+            # Другие СУБД: отбрасываем уже существующие пары отдельным запросом
+            existing = set(db.execute(select(table.c.user_id, table.c.group_id).where(
+                or_(*(and_(table.c.user_id == row["user_id"], table.c.group_id == row["group_id"]) for row in batch))
+            )).all())
+            batch = [row for row in batch if (row["user_id"], row["group_id"]) not in existing]
+            if not batch:
+                continue
+            statement = table.insert().values(batch)
+        added += db.execute(statement).rowcount
+    return added
+
+def add_users_to_group(db: Session, user_ids: list, group_id: int, teacher_id: int):
+    """Добавляет студентов в группу учителя одной транзакцией.
+    Возвращает {"added", "skipped"} или None, если группа не найдена."""
     # Проверяем, что группа принадлежит учителю
-    group = db.query(models.Group).filter(
+    group = db.query(models.Group.id).filter(
         models.Group.id == group_id,
         models.Group.teacher_id == teacher_id
     ).first()
     if not group:
-        return False
+        return None
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user or user.role != "student":
-        return False
+    student_ids = {row.id for row in db.query(models.User.id).filter(
+        models.User.id.in_(set(user_ids)),
+        models.User.role == "student"
+    )}
+    added = insert_group_memberships(db, [(user_id, group_id) for user_id in student_ids])
+    db.commit()
+    # skipped - не найденные пользователи и не студенты; уже состоящие в группе не ошибка
+    return {"added": added, "skipped": sorted(set(user_ids) - student_ids)}
 
-    if group not in user.groups:
-        user.groups.append(group)
-        db.commit()
-    return True
+def add_user_to_group(db: Session, user_id: int, group_id: int, teacher_id: int):
+    result = add_users_to_group(db, [user_id], group_id, teacher_id)
+    return bool(result) and not result["skipped"]
 
 def remove_user_from_group(db: Session, user_id: int, group_id: int, teacher_id: int):
     group = db.query(models.Group).filter(
@@ -126,23 +210,43 @@ def get_students_not_in_group(db: Session, group_id: int):
 
 # --------- Задания ---------
 def get_assignments(db: Session, teacher_id: int = None, user_id: int = None):
+    """Задания с загруженной группой (для group_name) одним запросом"""
+    query = db.query(models.Assignment).options(joinedload(models.Assignment.group))
     if teacher_id:
         # Учителя видят только свои задания
-        return db.query(models.Assignment).filter(models.Assignment.teacher_id == teacher_id).all()
+        return query.filter(models.Assignment.teacher_id == teacher_id).all()
     elif user_id:
         # Студенты видят только задания из групп, в которых они состоят
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user or user.role != "student":
-            return []
-
-        group_ids = [group.id for group in user.groups]
-        if not group_ids:
-            return []
-
-        return db.query(models.Assignment).filter(models.Assignment.group_id.in_(group_ids)).all()
+        return query.join(
+            models.user_group_association, models.user_group_association.c.group_id == models.Assignment.group_id
+        ).filter(models.user_group_association.c.user_id == user_id).all()
 
     # Админы видят все задания
-    return db.query(models.Assignment).all()
+    return query.all()
+
+def assignments_version(db: Session, teacher_id: int = None, user_id: int = None) -> tuple:
+    """Сводка заданий, видимых пользователю (как в get_assignments), для ETag списка.
+    Меняется при добавлении, удалении и изменении задания и его группы (название группы
+    входит в ответ)."""
+    query = db.query(
+        func.count(models.Assignment.id),
+        func.max(models.Assignment.id),
+        func.max(models.Assignment.updated_at),
+        func.max(models.Group.updated_at),
+        # updated_at хранится с точностью до секунды - длины полей ловят правки в ту же секунду
+        func.sum(func.length(models.Assignment.title) + func.coalesce(func.length(models.Assignment.description), 0)
+                 + func.coalesce(func.length(models.Assignment.tests), 0)
+                 + func.coalesce(func.length(models.Group.name), 0))
+    ).outerjoin(
+        models.Group, models.Group.id == models.Assignment.group_id
+    )
+    if teacher_id:
+        query = query.filter(models.Assignment.teacher_id == teacher_id)
+    elif user_id:
+        query = query.join(
+            models.user_group_association, models.user_group_association.c.group_id == models.Assignment.group_id
+        ).filter(models.user_group_association.c.user_id == user_id)
+    return tuple(query.one())
 
 def create_assignment(db: Session, assignment: schemas.AssignmentCreate, teacher_id: int):
     # Проверяем, что группа принадлежит учителю
@@ -201,6 +305,10 @@ def update_assignment(db: Session, assignment_id: int, assignment_data: schemas.
         except:
             pass
 
+    # Изменились тесты - кэшированные результаты проверки больше не действительны
+    if assignment.tests != assignment_data.tests or assignment.expected_output != assignment_data.expected_output:
+        invalidate_analysis_cache(db, assignment_id)
+
     assignment.title = assignment_data.title
     assignment.description = assignment_data.description
     assignment.expected_output = assignment_data.expected_output
@@ -213,26 +321,38 @@ def update_assignment(db: Session, assignment_id: int, assignment_data: schemas.
     db.refresh(assignment)
     return assignment
 
+def delete_solutions_where(db: Session, condition) -> dict:
+    """Удаляет решения, подходящие под условие, вместе с историей и отпечатками -
+    по одному DELETE ... WHERE ... IN (подзапрос) на таблицу (без commit). Возвращает число строк."""
+    solution_ids = select(models.Solution.id).where(condition)
+    counts = {
+        "solution_history": db.query(models.SolutionHistory).filter(
+            models.SolutionHistory.solution_id.in_(solution_ids)
+        ).delete(synchronize_session=False),
+        "solution_fingerprints": db.query(models.SolutionFingerprint).filter(
+            models.SolutionFingerprint.solution_id.in_(solution_ids)
+        ).delete(synchronize_session=False)
+    }
+    counts["solutions"] = db.query(models.Solution).filter(condition).delete(synchronize_session=False)
+    return counts
+
 def delete_assignment(db: Session, assignment_id: int, teacher_id: int):
-    assignment = db.query(models.Assignment).filter(
+    """Удаляет задание с решениями, историей, отпечатками и кэшем в одной транзакции.
+    Возвращает число удаленных строк по таблицам или None, если задание не найдено."""
+    assignment = db.query(models.Assignment.id).filter(
         models.Assignment.id == assignment_id,
         models.Assignment.teacher_id == teacher_id
     ).first()
     if not assignment:
-        return False
-
-    # Удаляем все связанные решения и их историю
-    solutions = db.query(models.Solution).filter(models.Solution.assignment_id == assignment_id).all()
-    for solution in solutions:
-        # Удаляем историю решений
-        db.query(models.SolutionHistory).filter(models.SolutionHistory.solution_id == solution.id).delete()
-        # Удаляем само решение
-        db.delete(solution)
+        return None
 
-    # Удаляем задание
-    db.delete(assignment)
+    counts = delete_solutions_where(db, models.Solution.assignment_id == assignment_id)
+    counts["analysis_cache"] = invalidate_analysis_cache(db, assignment_id)
+    counts["assignments"] = db.query(models.Assignment).filter(
+        models.Assignment.id == assignment_id
+    ).delete(synchronize_session=False)
     db.commit()
-    return True
+    return counts
 
 # --------- Решения ---------
 def save_solution(db: Session, username: str, assignment_id: int, code: str, result: dict, plagiarism_data: dict):
@@ -245,8 +365,9 @@ def save_solution(db: Session, username: str, assignment_id: int, code: str, res
     ).first()
 
     plagiarism_text = ""
-    if plagiarism_data["is_plagiarized"]:
-        plagiarism_text = f"Плагиат обнаружен. Похоже на работы: {', '.join(plagiarism_data['similar_users'])}"
+    if plagiarism_data["is_plagiarism"]:
+        similar = [f"{u['username']} ({u['similarity']}%)" for u in plagiarism_data["similar_users"]]
+        plagiarism_text = f"Плагиат обнаружен. Похоже на работы: {', '.join(similar)}"
     else:
         plagiarism_text = "Плагиат не обнаружен"
 
@@ -258,6 +379,9 @@ def save_solution(db: Session, username: str, assignment_id: int, code: str, res
             errors=existing_solution.errors,
             performance=existing_solution.performance,
             plagiarism=existing_solution.plagiarism,
+            normalized_ast=existing_solution.normalized_ast,
+            fingerprint=existing_solution.fingerprint,
+            fingerprint_version=existing_solution.fingerprint_version,
             submitted_at=existing_solution.submitted_at,
             solution_id=existing_solution.id
         )
@@ -281,6 +405,7 @@ def save_solution(db: Session, username: str, assignment_id: int, code: str, res
         existing_solution.is_checked = False
         existing_solution.checked_at = None
 
+        store_solution_fingerprint(db, existing_solution)
         db.commit()
         db.refresh(existing_solution)
         return existing_solution
@@ -301,34 +426,310 @@ def save_solution(db: Session, username: str, assignment_id: int, code: str, res
             assignment_id=assignment_id
         )
         db.add(db_solution)
+        try:
+            db.flush()
+        except IntegrityError:
+            # Решение успели вставить параллельно (другой процесс с той же базой) -
+            # уникальный индекс ux_solutions_user_assignment; сохраняем как повторную отправку
+            db.rollback()
+            return save_solution(db, username, assignment_id, code, result, plagiarism_data)
+        store_solution_fingerprint(db, db_solution)
         db.commit()
         db.refresh(db_solution)
         return db_solution
 
-def get_solutions_for_assignment(db: Session, assignment_id: int):
+def compute_fingerprint_fields(code: str) -> dict:
+    """Нормализованный AST и отпечатки кода - считаются один раз при сохранении"""
+    hashes = fingerprint(code)
+    return {
+        "normalized_ast": normalize_ast(code),
+        "fingerprint": encode_fingerprint(hashes),
+        "fingerprint_version": FINGERPRINT_VERSION,
+        "hashes": hashes
+    }
+
+def store_solution_fingerprint(db: Session, solution: models.Solution):
+    """Сохраняет отпечатки решения в его строке и в индексе плагиата (без commit)"""
+    fields = compute_fingerprint_fields(solution.code)
+    solution.normalized_ast = fields["normalized_ast"]
+    solution.fingerprint = fields["fingerprint"]
+    solution.fingerprint_version = fields["fingerprint_version"]
+
+    db.query(models.SolutionFingerprint).filter(models.SolutionFingerprint.solution_id == solution.id).delete()
+    rows = [
+        {"solution_id": solution.id, "assignment_id": solution.assignment_id, "hash": h}
+        for h in fields["hashes"]
+    ]
+    if rows:
+        db.execute(models.SolutionFingerprint.__table__.insert(), rows)
+
+# --------- Кэш результатов проверки ---------
+def get_cached_analysis(db: Session, key: str):
+    entry = db.query(models.AnalysisCache).filter(models.AnalysisCache.key == key).first()
+    if not entry:
+        return None
+
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = func.now()
+    db.commit()
+    return entry
+
+def store_cached_analysis(db: Session, key: str, assignment_id: int, code_hash: str, result: dict,
+                          max_entries: int, max_bytes: int):
+    data = json.dumps(result, ensure_ascii=False)
+    entry = db.query(models.AnalysisCache).filter(models.AnalysisCache.key == key).first()
+    if not entry:
+        entry = models.AnalysisCache(key=key, assignment_id=assignment_id)
+        db.add(entry)
+    entry.code_hash = code_hash
+    entry.result = data
+    entry.size = len(data.encode("utf-8"))
+    entry.last_used_at = func.now()
+    db.flush()
+
+    # Вытесняем давно не использованные записи сверх лимитов одним DELETE:
+    # самые старые excess_entries записей и столько старых, чтобы освободить excess_bytes
+    count, total_size = db.query(
+        func.count(models.AnalysisCache.key),
+        func.coalesce(func.sum(models.AnalysisCache.size), 0)
+    ).one()
+    excess_entries = count - max_entries
+    excess_bytes = total_size - max_bytes
+    if excess_entries > 0 or excess_bytes > 0:
+        oldest_first = (models.AnalysisCache.last_used_at, models.AnalysisCache.key)
+        ranked = db.query(
+            models.AnalysisCache.key.label("key"),
+            models.AnalysisCache.size.label("size"),
+            func.row_number().over(order_by=oldest_first).label("position"),
+            func.sum(models.AnalysisCache.size).over(order_by=oldest_first).label("running_size"),
+        ).filter(models.AnalysisCache.key != key).subquery()
+        victims = select(ranked.c.key).where(or_(
+            ranked.c.position <= excess_entries,
+            ranked.c.running_size - ranked.c.size < excess_bytes
+        ))
+        db.query(models.AnalysisCache).filter(models.AnalysisCache.key.in_(victims)).delete(synchronize_session=False)
+    db.commit()
+
+def invalidate_analysis_cache(db: Session, assignment_id: int) -> int:
+    """Удаляет кэшированные результаты задания (без commit)"""
+    return db.query(models.AnalysisCache).filter(
+        models.AnalysisCache.assignment_id == assignment_id
+    ).delete(synchronize_session=False)
+
+# --------- Keyset-пагинация ---------
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(values: list) -> str:
+    data = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """Значения ключа последней строки предыдущей страницы; ValueError, если курсор испорчен"""
     try:
-        # Используем joinedload для оптимизации загрузки связанных данных
-        from sqlalchemy.orm import joinedload
-        
-        solutions = db.query(models.Solution).options(
-            joinedload(models.Solution.user)
-        ).filter(
-            models.Solution.assignment_id == assignment_id
-        ).order_by(
-            models.Solution.submitted_at.desc()
-        ).all()
-        
-        print(f"Загружено {len(solutions)} решений для задания {assignment_id}")
-        return solutions
-        
-    except Exception as e:
-        print(f"Ошибка получения решений из БД для задания {assignment_id}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return []
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Некорректный курсор")
+    if not isinstance(values, list):
+        raise ValueError("Некорректный курсор")
+    return values
+
+def prefix_filter(column, prefix: str):
+    # Диапазон вместо LIKE: в SQLite LIKE без учета регистра и не использует индекс
+    return and_(column >= prefix, column < prefix + "\U0010ffff")
+
+def _cursor_value(column, value):
+    # Даты в курсоре хранятся строкой ISO, для столбцов DateTime возвращаем datetime
+    if isinstance(value, str) and isinstance(column.type, DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError("Некорректный курсор")
+    return value
+
+def paginate(query, key_columns: list, key, cursor: str = None, limit: int = None, descending: bool = True):
+    """Страница query в порядке key_columns, начиная после cursor.
+
+    key(row) возвращает значения key_columns для строки. Возвращает
+    (строки, курсор следующей страницы или None).
+    """
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(key_columns):
+            raise ValueError("Некорректный курсор")
+        values = [_cursor_value(column, value) for column, value in zip(key_columns, values)]
+        # (a, b) < (x, y) для СУБД без сравнения кортежей: a < x OR (a = x AND b < y)
+        conditions = []
+        for i, column in enumerate(key_columns):
+            equal = [key_columns[j] == values[j] for j in range(i)]
+            conditions.append(and_(*equal, column < values[i] if descending else column > values[i]))
+        query = query.filter(or_(*conditions))
+
+    order = [column.desc() if descending else column.asc() for column in key_columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+def solution_submitted_key(db: Session):
+    """Первый столбец ключа сортировки решений (submitted_at, id).
+
+    В SQLite дата сравнивается в том виде, в каком хранится, иначе '... 19:22:17'
+    не равно параметру '... 19:22:17.000000'. В PostgreSQL - обычный timestamp.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return type_coerce(models.Solution.submitted_at, String)
+    return models.Solution.submitted_at
+
+# Поля списка решений задания: без кода и результатов тестов (они - в get_solution_details)
+SOLUTION_SUMMARY_COLUMNS = (
+    models.Solution.id,
+    models.Solution.style,
+    models.Solution.errors,
+    models.Solution.performance,
+    models.Solution.plagiarism,
+    models.Solution.submitted_at,
+    models.Solution.teacher_grade,
+    models.Solution.teacher_comment,
+    models.Solution.is_checked,
+    models.Solution.checked_at,
+    models.Solution.tests_passed,
+    models.Solution.total_tests,
+    models.User.username,
+    models.User.first_name,
+    models.User.last_name
+)
+
+def get_solution_summaries(db: Session, assignment_id: int, cursor: str = None, limit: int = None,
+                           is_checked: bool = None, tests_min: int = None, tests_max: int = None,
+                           username: str = None):
+    """Страница строк (не ORM-объектов) с краткими данными решений задания и именами студентов,
+    новые первыми: (строки, курсор следующей страницы)"""
+    submitted_key = solution_submitted_key(db)
+    query = db.query(*SOLUTION_SUMMARY_COLUMNS, submitted_key.label("submitted_at_key")).outerjoin(
+        models.User, models.User.id == models.Solution.user_id
+    ).filter(
+        models.Solution.assignment_id == assignment_id
+    )
+    if is_checked is not None:
+        query = query.filter(models.Solution.is_checked == is_checked)
+    if tests_min is not None:
+        query = query.filter(models.Solution.tests_passed >= tests_min)
+    if tests_max is not None:
+        query = query.filter(models.Solution.tests_passed <= tests_max)
+    if username:
+        query = query.filter(prefix_filter(models.User.username, username))
+
+    return paginate(query, [submitted_key, models.Solution.id],
+                    lambda row: [row.submitted_at_key, row.id], cursor, limit)
+
+EXPORT_BATCH_SIZE = 500
+
+def get_export_solutions(db: Session, teacher_id: int, assignment_id: int = None, group_id: int = None,
+                         with_code: bool = False):
+    """Решения заданий учителя для выгрузки - строки, которые читаются с сервера
+    пакетами по EXPORT_BATCH_SIZE (yield_per), а не загружаются списком"""
+    columns = [
+        models.Solution.id,
+        models.Solution.assignment_id,
+        models.Assignment.title.label("assignment_title"),
+        models.Assignment.group_id,
+        models.Group.name.label("group_name"),
+        models.User.username,
+        models.User.last_name,
+        models.User.first_name,
+        models.Solution.tests_passed,
+        models.Solution.total_tests,
+        models.Solution.teacher_grade,
+        models.Solution.teacher_comment,
+        models.Solution.is_checked,
+        models.Solution.checked_at,
+        models.Solution.submitted_at
+    ]
+    if with_code:
+        columns.append(models.Solution.code)
+    query = db.query(*columns).join(
+        models.Assignment, models.Assignment.id == models.Solution.assignment_id
+    ).join(
+        models.Group, models.Group.id == models.Assignment.group_id
+    ).outerjoin(
+        models.User, models.User.id == models.Solution.user_id
+    ).filter(
+        models.Assignment.teacher_id == teacher_id
+    )
+    if assignment_id is not None:
+        query = query.filter(models.Solution.assignment_id == assignment_id)
+    if group_id is not None:
+        query = query.filter(models.Assignment.group_id == group_id)
+    return query.order_by(
+        models.Solution.assignment_id, models.User.username, models.Solution.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def get_solution_details(db: Session, solution_id: int, teacher_id: int):
+    """Код и результаты тестов решения, если задание принадлежит учителю"""
+    return db.query(
+        models.Solution.id,
+        models.Solution.code,
+        models.Solution.test_results
+    ).join(
+        models.Assignment, models.Assignment.id == models.Solution.assignment_id
+    ).filter(
+        models.Solution.id == solution_id,
+        models.Assignment.teacher_id == teacher_id
+    ).first()
 
-def get_user_solutions(db: Session, user_id: int):
-    return db.query(models.Solution).filter(models.Solution.user_id == user_id).all()
+def get_user_solutions(db: Session, user_id: int, cursor: str = None, limit: int = None,
+                       assignment_id: int = None, group_id: int = None, is_checked: bool = None):
+    """Страница решений пользователя, новые первыми: (решения, курсор следующей страницы)"""
+    submitted_key = solution_submitted_key(db)
+    # Названия заданий - одним дополнительным запросом на страницу
+    query = db.query(models.Solution, submitted_key.label("submitted_at_key")).options(
+        selectinload(models.Solution.assignment).load_only(models.Assignment.title)
+    ).filter(
+        models.Solution.user_id == user_id
+    )
+    if assignment_id is not None:
+        query = query.filter(models.Solution.assignment_id == assignment_id)
+    if group_id is not None:
+        query = query.join(models.Assignment, models.Assignment.id == models.Solution.assignment_id).filter(
+            models.Assignment.group_id == group_id
+        )
+    if is_checked is not None:
+        query = query.filter(models.Solution.is_checked == is_checked)
+
+    rows, next_cursor = paginate(query, [submitted_key, models.Solution.id],
+                                 lambda row: [row.submitted_at_key, row.Solution.id], cursor, limit)
+    return [row.Solution for row in rows], next_cursor
+
+def solutions_version(db: Session, assignment_id: int = None, user_id: int = None) -> tuple:
+    """Сводка решений задания или пользователя для ETag списка: меняется при новой
+    отправке, повторной отправке, оценке и удалении решения, а также при изменении
+    имен студентов и названий заданий, которые входят в ответ."""
+    query = db.query(
+        func.count(models.Solution.id),
+        func.max(models.Solution.id),
+        func.max(models.Solution.last_modified),
+        func.max(models.Solution.checked_at),
+        func.count(models.Solution.checked_at),
+        func.sum(func.coalesce(models.Solution.teacher_grade, 0)),
+        func.sum(func.coalesce(models.Solution.tests_passed, 0)),
+        func.max(models.User.updated_at),
+        func.max(models.Assignment.updated_at),
+        # updated_at хранится с точностью до секунды - длины полей ловят правки в ту же секунду
+        func.sum(func.coalesce(func.length(models.User.first_name) + func.length(models.User.last_name), 0)
+                 + func.coalesce(func.length(models.Assignment.title), 0))
+    ).outerjoin(
+        models.User, models.User.id == models.Solution.user_id
+    ).outerjoin(
+        models.Assignment, models.Assignment.id == models.Solution.assignment_id
+    )
+    if assignment_id is not None:
+        query = query.filter(models.Solution.assignment_id == assignment_id)
+    if user_id is not None:
+        query = query.filter(models.Solution.user_id == user_id)
+    return tuple(query.one())
 
 def update_solution_grade(db: Session, solution_id: int, grade: int, comment: str = None):
     solution = db.query(models.Solution).filter(models.Solution.id == solution_id).first()
@@ -359,26 +760,35 @@ def set_teacher_code(db: Session, code: str):
         db.add(setting)
     db.commit()
 
-def get_all_users(db: Session):
-    return db.query(models.User).all()
+def get_all_users(db: Session, cursor: str = None, limit: int = None, role: str = None,
+                  username: str = None, exclude_role: str = None):
+    """Страница пользователей по возрастанию id: (пользователи, курсор следующей страницы)"""
+    query = db.query(models.User)
+    if role:
+        query = query.filter(models.User.role == role)
+    if exclude_role:
+        query = query.filter(models.User.role != exclude_role)
+    if username:
+        query = query.filter(prefix_filter(models.User.username, username))
+    return paginate(query, [models.User.id], lambda u: [u.id], cursor, limit, descending=False)
 
 def delete_user(db: Session, user_id: int):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    """Удаляет пользователя с решениями, историей, членством в группах и заявками в одной транзакции.
+    Возвращает число удаленных строк по таблицам или None, если удалять некого."""
+    user = db.query(models.User.role).filter(models.User.id == user_id).first()
     if not user or user.role == "admin":
-        return False
-
-    # Удаляем все решения пользователя и их историю
-    solutions = db.query(models.Solution).filter(models.Solution.user_id == user_id).all()
-    for solution in solutions:
-        # Удаляем историю решений
-        db.query(models.SolutionHistory).filter(models.SolutionHistory.solution_id == solution.id).delete()
-        # Удаляем само решение
-        db.delete(solution)
+        return None
 
-    # Удаляем пользователя
-    db.delete(user)
+    counts = delete_solutions_where(db, models.Solution.user_id == user_id)
+    counts["user_groups"] = db.execute(
+        models.user_group_association.delete().where(models.user_group_association.c.user_id == user_id)
+    ).rowcount
+    counts["group_join_requests"] = db.query(models.GroupJoinRequest).filter(
+        models.GroupJoinRequest.user_id == user_id
+    ).delete(synchronize_session=False)
+    counts["users"] = db.query(models.User).filter(models.User.id == user_id).delete(synchronize_session=False)
     db.commit()
-    return True
+    return counts
 
 def get_pending_teachers(db: Session):
     return db.query(models.User).filter(
@@ -451,32 +861,31 @@ def get_group_join_requests(db: Session, group_id: int):
         models.GroupJoinRequest.group_id == group_id
     ).all()
 
-def approve_group_join_request(db: Session, request_id: int, teacher_id: int):
-    join_request = db.query(models.GroupJoinRequest).filter(
-        models.GroupJoinRequest.id == request_id
-    ).first()
-
-    if not join_request:
-        return False
-
-    # Проверяем, что группа принадлежит учителю
-    group = db.query(models.Group).filter(
-        models.Group.id == join_request.group_id,
+def approve_group_join_requests(db: Session, request_ids: list, teacher_id: int) -> dict:
+    """Одобряет заявки в группы учителя: один INSERT в user_groups, один DELETE заявок, один commit.
+    Возвращает {"approved", "added", "skipped"}; skipped - не найденные или чужие заявки."""
+    join_requests = db.query(
+        models.GroupJoinRequest.id,
+        models.GroupJoinRequest.user_id,
+        models.GroupJoinRequest.group_id
+    ).join(
+        models.Group, models.Group.id == models.GroupJoinRequest.group_id
+    ).filter(
+        models.GroupJoinRequest.id.in_(set(request_ids)),
         models.Group.teacher_id == teacher_id
-    ).first()
-
-    if not group:
-        return False
-
-    # Добавляем пользователя в группу
-    user = db.query(models.User).filter(models.User.id == join_request.user_id).first()
-    if user and group not in user.groups:
-        user.groups.append(group)
+    ).all()
 
-    # Удаляем заявку
-    db.delete(join_request)
+    approved_ids = {join_request.id for join_request in join_requests}
+    added = insert_group_memberships(db, [(join_request.user_id, join_request.group_id) for join_request in join_requests])
+    if approved_ids:
+        db.query(models.GroupJoinRequest).filter(
+            models.GroupJoinRequest.id.in_(approved_ids)
+        ).delete(synchronize_session=False)
     db.commit()
-    return True
+    return {"approved": len(approved_ids), "added": added, "skipped": sorted(set(request_ids) - approved_ids)}
+
+def approve_group_join_request(db: Session, request_id: int, teacher_id: int):
+    return approve_group_join_requests(db, [request_id], teacher_id)["approved"] == 1
 
 def reject_group_join_request(db: Session, request_id: int, teacher_id: int):
     join_request = db.query(models.GroupJoinRequest).filter(
@@ -501,32 +910,31 @@ def reject_group_join_request(db: Session, request_id: int, teacher_id: int):
     return True
 
 def delete_group(db: Session, group_id: int, teacher_id: int):
+    """Удаляет группу с заданиями, решениями, историей, кэшем, членством и заявками в одной
+    транзакции. Возвращает число удаленных строк по таблицам или None, если группа не найдена."""
     # Проверяем, что группа принадлежит учителю
-    group = db.query(models.Group).filter(
+    group = db.query(models.Group.id).filter(
         models.Group.id == group_id,
         models.Group.teacher_id == teacher_id
     ).first()
 
     if not group:
-        return False
+        return None
 
-    # Удаляем все задания группы и связанные с ними решения
-    assignments = db.query(models.Assignment).filter(models.Assignment.group_id == group_id).all()
-    for assignment in assignments:
-        # Удаляем все решения задания и их историю
-        solutions = db.query(models.Solution).filter(models.Solution.assignment_id == assignment.id).all()
-        for solution in solutions:
-            # Удаляем историю решений
-            db.query(models.SolutionHistory).filter(models.SolutionHistory.solution_id == solution.id).delete()
-            # Удаляем само решение
-            db.delete(solution)
-        # Удаляем задание
-        db.delete(assignment)
-
-    # Удаляем все заявки на вступление в группу
-    db.query(models.GroupJoinRequest).filter(models.GroupJoinRequest.group_id == group_id).delete()
-
-    # Удаляем группу (связи с пользователями удалятся автоматически)
-    db.delete(group)
+    assignment_ids = select(models.Assignment.id).where(models.Assignment.group_id == group_id)
+    counts = delete_solutions_where(db, models.Solution.assignment_id.in_(assignment_ids))
+    counts["analysis_cache"] = db.query(models.AnalysisCache).filter(
+        models.AnalysisCache.assignment_id.in_(assignment_ids)
+    ).delete(synchronize_session=False)
+    counts["assignments"] = db.query(models.Assignment).filter(
+        models.Assignment.group_id == group_id
+    ).delete(synchronize_session=False)
+    counts["group_join_requests"] = db.query(models.GroupJoinRequest).filter(
+        models.GroupJoinRequest.group_id == group_id
+    ).delete(synchronize_session=False)
+    counts["user_groups"] = db.execute(
+        models.user_group_association.delete().where(models.user_group_association.c.group_id == group_id)
+    ).rowcount
+    counts["groups"] = db.query(models.Group).filter(models.Group.id == group_id).delete(synchronize_session=False)
     db.commit()
-    return True
\ No newline at end of file
+    return counts
\ No newline at end of file
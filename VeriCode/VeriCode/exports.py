@@ -0,0 +1,220 @@
+"""Потоковая выгрузка решений и оценок (GET /api/export/solutions).
+
+Строки читаются из базы пакетами (crud.get_export_solutions, yield_per) и сразу
+отдаются клиенту кусками через StreamingResponse, поэтому память не растет с
+размером курса. Форматы: csv, ndjson и xlsx (если установлен пакет openpyxl).
+С code=true ответ - zip-архив с таблицей и кодом каждого решения
+(code/<группа>/<задание>/<логин>.py), архив тоже пишется потоком.
+"""
+import csv
+import io
+import json
+import logging
+import re
+import tempfile
+import zipfile
+from datetime import datetime
+from database import SessionLocal
+import crud
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (тип содержимого, расширение файла)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx")
+}
+EXPORT_COLUMNS = (
+    "solution_id", "assignment_id", "assignment", "group_id", "group", "username", "full_name",
+    "tests_passed", "total_tests", "teacher_grade", "teacher_comment", "is_checked",
+    "checked_at", "submitted_at"
+)
+# Сколько строк CSV/NDJSON собирать в один кусок ответа
+EXPORT_CHUNK_ROWS = 200
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+_UNSAFE_PATH_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def format_available(fmt: str) -> bool:
+    return fmt != "xlsx" or Workbook is not None
+
+
+def export_filename(fmt: str, with_code: bool = False, assignment_id: int = None, group_id: int = None) -> str:
+    if assignment_id is not None:
+        scope = f"assignment_{assignment_id}"
+    elif group_id is not None:
+        scope = f"group_{group_id}"
+    else:
+        scope = "all"
+    return f"solutions_{scope}.{'zip' if with_code else EXPORT_FORMATS[fmt][1]}"
+
+
+def export_media_type(fmt: str, with_code: bool = False) -> str:
+    return "application/zip" if with_code else EXPORT_FORMATS[fmt][0]
+
+
+def _record(row) -> dict:
+    return {
+        "solution_id": row.id,
+        "assignment_id": row.assignment_id,
+        "assignment": row.assignment_title,
+        "group_id": row.group_id,
+        "group": row.group_name,
+        "username": row.username,
+        "full_name": f"{row.last_name} {row.first_name}" if row.username else None,
+        "tests_passed": row.tests_passed or 0,
+        "total_tests": row.total_tests or 0,
+        "teacher_grade": row.teacher_grade,
+        "teacher_comment": row.teacher_comment,
+        "is_checked": bool(row.is_checked),
+        "checked_at": row.checked_at,
+        "submitted_at": row.submitted_at
+    }
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    # BOM и ";" - чтобы Excel с русской локалью открыл файл без мастера импорта
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow(EXPORT_COLUMNS)
+    for number, row in enumerate(rows, start=1):
+        record = _record(row)
+        writer.writerow([_csv_value(record[column]) for column in EXPORT_COLUMNS])
+        if number % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(_record(row), ensure_ascii=False, default=lambda value: value.isoformat()))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _xlsx_value(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)  # openpyxl не записывает даты с часовым поясом
+    return value
+
+
+def _xlsx_chunks(rows):
+    # Лист в режиме write_only пишется на диск по мере добавления строк; xlsx - zip с
+    # оглавлением в конце, поэтому файл собирается во временном файле и затем отдается
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Решения")
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        record = _record(row)
+        sheet.append([_xlsx_value(record[column]) for column in EXPORT_COLUMNS])
+    with tempfile.TemporaryFile() as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(EXPORT_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _table_chunks(rows, fmt: str):
+    if fmt == "ndjson":
+        return _ndjson_chunks(rows)
+    if fmt == "xlsx":
+        return _xlsx_chunks(rows)
+    return _csv_chunks(rows)
+
+
+class _ZipSink:
+    """Поток только для записи: zipfile пишет в него, генератор забирает накопленное.
+    Без tell() zipfile считает поток непозиционируемым и пишет data descriptor."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Накопленные байты одним куском (ничего, если zipfile еще ничего не записал)"""
+        if self._parts:
+            data = b"".join(self._parts)
+            self._parts = []
+            yield data
+
+
+def _safe_name(name) -> str:
+    return _UNSAFE_PATH_CHARS.sub("_", str(name)).strip(" .") or "_"
+
+
+def _code_path(row) -> str:
+    student = row.username or f"solution_{row.id}"
+    return "/".join([
+        "code",
+        _safe_name(row.group_name),
+        _safe_name(f"{row.assignment_id}_{row.assignment_title}"),
+        f"{_safe_name(student)}.py"
+    ])
+
+
+def _zip_chunks(db, fmt: str, teacher_id: int, assignment_id: int = None, group_id: int = None):
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f"solutions.{EXPORT_FORMATS[fmt][1]}", "w") as table:
+            rows = crud.get_export_solutions(db, teacher_id, assignment_id=assignment_id, group_id=group_id)
+            for chunk in _table_chunks(rows, fmt):
+                table.write(chunk)
+                yield from sink.drain()
+        # Код - вторым проходом: в zip нельзя писать два файла одновременно
+        rows = crud.get_export_solutions(db, teacher_id, assignment_id=assignment_id, group_id=group_id,
+                                         with_code=True)
+        for row in rows:
+            archive.writestr(_code_path(row), row.code or "")
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def stream_export(teacher_id: int, fmt: str = "csv", assignment_id: int = None, group_id: int = None,
+                  with_code: bool = False):
+    """Куски (bytes) выгрузки решений заданий учителя.
+
+    Генератор открывает свою сессию: StreamingResponse читает его уже после
+    возврата из обработчика, когда сессия запроса может быть закрыта."""
+    db = SessionLocal()
+    try:
+        if with_code:
+            yield from _zip_chunks(db, fmt, teacher_id, assignment_id=assignment_id, group_id=group_id)
+        else:
+            rows = crud.get_export_solutions(db, teacher_id, assignment_id=assignment_id, group_id=group_id)
+            yield from _table_chunks(rows, fmt)
+        logger.info("Выгрузка решений учителя %s завершена (%s, код: %s)", teacher_id, fmt, with_code)
+    finally:
+        db.close()
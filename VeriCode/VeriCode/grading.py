@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import crud
+from database import SessionLocal
+from utils import analyze_code, analyze_code_cached, detect_plagiarism
+from logs import request_id_var
+
+# Настройки очереди проверки решений (переопределяются переменными окружения)
+# Потоки: код студентов выполняется в процессах песочницы, поток в основном ждет их
+GRADING_WORKERS = int(os.getenv("VERICODE_GRADING_WORKERS", os.cpu_count() or 2))
+GRADING_QUEUE_LIMIT = int(os.getenv("VERICODE_GRADING_QUEUE_LIMIT", 1000))
+GRADING_JOB_TTL = int(os.getenv("VERICODE_GRADING_JOB_TTL", 3600))  # секунды хранения результата
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Очередь проверки переполнена"""
+
+
+class SubmissionQueue:
+    """Очередь отправленных решений с локальным пулом потоков-воркеров.
+
+    Воркер проверяет решение (стиль, запуск и тесты в песочнице), ищет плагиат и
+    сохраняет результат со своей сессией БД. Отправки одного пользователя по одному
+    заданию проверяются по очереди, в порядке отправки.
+    """
+
+    def __init__(self, workers: int = GRADING_WORKERS, queue_limit: int = GRADING_QUEUE_LIMIT,
+                 job_ttl: int = GRADING_JOB_TTL):
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        # (user_id, assignment_id) -> отправки, ждущие завершения проверки предыдущей
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._dispatcher = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="grading")
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, user_id: int, username: str, assignment_id: int, code: str,
+               expected_output: str = None, tests: str = None) -> str:
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if job["status"] in (STATUS_QUEUED, STATUS_RUNNING))
+            if pending >= self.queue_limit:
+                raise QueueFullError("Очередь проверки переполнена")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "user_id": user_id,
+                "assignment_id": assignment_id,
+                "status": STATUS_QUEUED,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+
+            # Сообщения проверки помечаются request_id отправившего запроса
+            key = (user_id, assignment_id)
+            task = (job_id, username, code, expected_output, tests, request_id_var.get())
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting.append(task)
+                return job_id
+            self._waiting[key] = deque()
+
+        self._dispatcher.submit(self._run_in_order, key, task)
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields)
+            return dict(job) if job else None
+
+    def _run_in_order(self, key: tuple, task: tuple):
+        try:
+            self._run(*task)
+        finally:
+            with self._lock:
+                waiting = self._waiting[key]
+                task = waiting.popleft() if waiting else None
+                if task is None:
+                    del self._waiting[key]
+            if task is not None:
+                self._dispatcher.submit(self._run_in_order, key, task)
+
+    def _run(self, job_id: str, username: str, code: str, expected_output: str, tests: str, request_id: str = "-"):
+        request_id_var.set(request_id)
+        job = self._update(job_id, status=STATUS_RUNNING)
+        if not job:
+            return
+
+        started = time.perf_counter()
+        try:
+            logger.debug("Начинаем анализ решения %s пользователя %s", job_id, username)
+            # Кэш читается и пишется короткими сессиями: во время анализа соединение свободно
+            result = analyze_code_cached(SessionLocal, job["assignment_id"], code, expected_output, tests,
+                                         analyze=analyze_code)
+            db = SessionLocal()
+            try:
+                plagiarism_data = detect_plagiarism(db, code, job["assignment_id"], job["user_id"])
+                solution = crud.save_solution(db, username, job["assignment_id"], code, result, plagiarism_data)
+                solution_id = solution.id
+            finally:
+                db.close()
+
+            self._update(job_id, status=STATUS_DONE, finished_at=time.time(), result={
+                "solution_id": solution_id,
+                "style": result["style"],
+                "errors": result["errors"],
+                "performance": result["performance"],
+                "output_check": result["output_check"],
+                "tests_passed": result.get("tests_passed", 0),
+                "total_tests": result.get("total_tests", 0),
+                "plagiarism": plagiarism_data["similar_users"] if plagiarism_data["is_plagiarism"] else "Плагиат не обнаружен"
+            })
+            logger.info("Решение %s проверено и сохранено за %.0f мс", job_id, (time.perf_counter() - started) * 1000,
+                        extra={"job_id": job_id, "assignment_id": job["assignment_id"], "user_id": job["user_id"]})
+        except Exception as e:
+            logger.exception("Ошибка при обработке решения %s", job_id)
+            self._update(job_id, status=STATUS_FAILED, finished_at=time.time(), error=f"Ошибка обработки: {str(e)}")
+
+    def shutdown(self):
+        self._dispatcher.shutdown(wait=False, cancel_futures=True)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_submission_queue() -> SubmissionQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = SubmissionQueue()
+        return _queue
+
+
+def shutdown_submission_queue():
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        queue.shutdown()
@@ -0,0 +1,197 @@
+"""Проверка стиля кода внутри приложения, без запуска flake8 на каждое решение.
+
+Линтеры (pycodestyle и pyflakes - те же, что использует flake8) загружаются
+один раз, код проверяется из памяти без временных файлов. Формат вывода
+совпадает с flake8 (`путь:строка:столбец: КОД текст`), как и раньше в
+Solution.style. Нужны только pycodestyle и pyflakes: коды pyflakes и разбор
+`# noqa` повторяют flake8 здесь, а не берутся из его внутренних модулей. Если
+пакетов нет, используется запуск flake8.
+"""
+import ast
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import pycodestyle
+    from pyflakes import checker as pyflakes_checker
+except ImportError:
+    pycodestyle = None
+
+# Путь в отчете как у прежних временных файлов - интерфейс вырезает префикс /tmp/....py
+STYLE_FILENAME = "/tmp/solution.py"
+STYLE_CACHE_SIZE = int(os.getenv("VERICODE_STYLE_CACHE_SIZE", 2048))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# `# noqa` и `# noqa: E501,W291` - как flake8.defaults.NOQA_INLINE_REGEXP
+NOQA_INLINE_REGEX = re.compile(
+    r"# noqa"
+    r"(?::[\s]?(?P<codes>([A-Z]+[0-9]+(?:[,\s]+)?)+))?",
+    re.IGNORECASE
+)
+
+# Класс сообщения pyflakes -> код flake8 (flake8.plugins.pyflakes.FLAKE8_PYFLAKES_CODES)
+PYFLAKES_CODES = {
+    "UnusedImport": "F401",
+    "ImportShadowedByLoopVar": "F402",
+    "ImportStarUsed": "F403",
+    "LateFutureImport": "F404",
+    "ImportStarUsage": "F405",
+    "ImportStarNotPermitted": "F406",
+    "FutureFeatureNotDefined": "F407",
+    "PercentFormatInvalidFormat": "F501",
+    "PercentFormatExpectedMapping": "F502",
+    "PercentFormatExpectedSequence": "F503",
+    "PercentFormatExtraNamedArguments": "F504",
+    "PercentFormatMissingArgument": "F505",
+    "PercentFormatMixedPositionalAndNamed": "F506",
+    "PercentFormatPositionalCountMismatch": "F507",
+    "PercentFormatStarRequiresSequence": "F508",
+    "PercentFormatUnsupportedFormatCharacter": "F509",
+    "StringDotFormatInvalidFormat": "F521",
+    "StringDotFormatExtraNamedArguments": "F522",
+    "StringDotFormatExtraPositionalArguments": "F523",
+    "StringDotFormatMissingArgument": "F524",
+    "StringDotFormatMixingAutomatic": "F525",
+    "FStringMissingPlaceholders": "F541",
+    "TStringMissingPlaceholders": "F542",
+    "MultiValueRepeatedKeyLiteral": "F601",
+    "MultiValueRepeatedKeyVariable": "F602",
+    "TooManyExpressionsInStarredAssignment": "F621",
+    "TwoStarredExpressions": "F622",
+    "AssertTuple": "F631",
+    "IsLiteral": "F632",
+    "InvalidPrintSyntax": "F633",
+    "IfTuple": "F634",
+    "BreakOutsideLoop": "F701",
+    "ContinueOutsideLoop": "F702",
+    "YieldOutsideFunction": "F704",
+    "ReturnOutsideFunction": "F706",
+    "DefaultExceptNotLast": "F707",
+    "LazyImportNotAtModuleScope": "F708",
+    "LazyImportStarNotPermitted": "F709",
+    "DoctestSyntaxError": "F721",
+    "ForwardAnnotationSyntaxError": "F722",
+    "RedefinedWhileUnused": "F811",
+    "UndefinedName": "F821",
+    "UndefinedExport": "F822",
+    "UndefinedLocal": "F823",
+    "UnusedIndirectAssignment": "F824",
+    "DuplicateArgument": "F831",
+    "UnusedVariable": "F841",
+    "UnusedAnnotation": "F842",
+    "EagerUseOfLazyImport": "F851",
+    "RaiseNotImplemented": "F901",
+}
+
+if pycodestyle is not None:
+    class _CollectingReport(pycodestyle.BaseReport):
+        """Собирает замечания pycodestyle вместо печати"""
+
+        def __init__(self, options):
+            super().__init__(options)
+            self.results = []
+
+        def error(self, line_number, offset, text, check):
+            code = super().error(line_number, offset, text, check)
+            if code:
+                self.results.append((line_number, offset + 1, text))
+            return code
+
+    class _Flake8Checker(pycodestyle.Checker):
+        """Checker без собственной обработки `# noqa` pycodestyle (аналог flake8 --disable-noqa
+        для плагина pycodestyle): pycodestyle по любому `# noqa` молча пропускает часть проверок,
+        а flake8 подавляет только перечисленные коды - это делает _noqa_filter"""
+
+        @property
+        def noqa(self):
+            return False
+
+        @noqa.setter
+        def noqa(self, value):
+            pass
+
+    # Настройки по умолчанию flake8: длина строки 79, стандартный список игнорируемых кодов
+    _style_guide = pycodestyle.StyleGuide(quiet=True, max_line_length=pycodestyle.MAX_LINE_LENGTH)
+
+
+def _noqa_filter(lines: list, results: list) -> list:
+    """Учитывает комментарии `# noqa` и `# noqa: E501,...` так же, как flake8"""
+    filtered = []
+    for row, col, text in results:
+        line = lines[row - 1] if 0 < row <= len(lines) else ""
+        match = NOQA_INLINE_REGEX.search(line)
+        if match:
+            codes = match.groupdict().get("codes")
+            if not codes:
+                continue
+            if any(text.startswith(code.strip()) for code in codes.replace(",", " ").split()):
+                continue
+        filtered.append((row, col, text))
+    return filtered
+
+
+def _check_in_process(code: str) -> str:
+    lines = code.splitlines(True)
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        # Как flake8: при синтаксической ошибке остальные проверки не выполняются
+        return f"{STYLE_FILENAME}:{e.lineno or 1}:{(e.offset or 0) + 1}: E999 {type(e).__name__}: {e.msg}"
+    except ValueError as e:
+        return f"{STYLE_FILENAME}:1:1: E999 {type(e).__name__}: {e}"
+
+    report = _CollectingReport(_style_guide.options)
+    _Flake8Checker(STYLE_FILENAME, lines=lines, options=_style_guide.options, report=report).check_all()
+    results = list(report.results)
+
+    for message in pyflakes_checker.Checker(tree, filename=STYLE_FILENAME).messages:
+        code_name = PYFLAKES_CODES.get(type(message).__name__, "F999")
+        text = message.message % message.message_args
+        results.append((message.lineno, message.col + 1, f"{code_name} {text}"))
+
+    results = _noqa_filter(lines, results)
+    results.sort(key=lambda item: (item[0], item[1]))
+    return "\n".join(f"{STYLE_FILENAME}:{row}:{col}: {text}" for row, col, text in results)
+
+
+def _check_with_flake8(code: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".py", mode='w') as temp:
+        temp.write(code)
+        temp_path = temp.name
+
+    try:
+        result = subprocess.run(["flake8", temp_path], capture_output=True, text=True)
+        return result.stdout.strip()
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def check_style(code: str) -> str:
+    """Замечания по стилю в формате flake8 (пустая строка - замечаний нет). Кэшируется по хешу кода."""
+    key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    if pycodestyle is not None:
+        report = _check_in_process(code)
+    else:
+        report = _check_with_flake8(code)
+
+    with _cache_lock:
+        _cache[key] = report
+        while len(_cache) > STYLE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return report
@@ -0,0 +1,196 @@
+"""Логирование: уровни, идентификатор запроса, запись через очередь.
+
+Модули пишут в logging.getLogger(__name__). Записи только кладутся в очередь
+(QueueHandler), в stderr их выводит отдельный поток QueueListener, поэтому
+медленный вывод не задерживает обработку запросов. При переполнении очереди
+записи отбрасываются, а не блокируют поток; сколько записей отброшено, пишется
+в лог предупреждением (не чаще раза в VERICODE_LOG_DROP_REPORT_INTERVAL секунд
+и при остановке).
+
+Каждая запись содержит request_id - из заголовка X-Request-ID или
+сгенерированный RequestIdMiddleware; в ответе он возвращается тем же
+заголовком. Настройки: VERICODE_LOG_LEVEL (INFO; DEBUG включает подробные
+сообщения по каждому запросу), VERICODE_LOG_FORMAT (text или json).
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("VERICODE_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("VERICODE_LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("VERICODE_LOG_QUEUE_SIZE", 10000))
+LOG_DROP_REPORT_INTERVAL = float(os.getenv("VERICODE_LOG_DROP_REPORT_INTERVAL", 60))  # секунды
+
+# Библиотеки, которые на уровне DEBUG пишут по строке на каждую операцию
+QUIET_LOGGERS = ("aiosqlite", "asyncio", "httpcore", "passlib", "python_multipart", "multipart")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+logger = logging.getLogger(__name__)
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# Атрибуты LogRecord, не относящиеся к полям extra=...
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет к записи request_id текущего запроса (или задачи проверки)"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra=... попадают в нее как есть"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при заполненной очереди отбрасывает запись вместо ожидания.
+
+    dropped - число отброшенных записей с запуска. О еще не отмеченных в логе пишется
+    сводка: следующей записью после освобождения очереди, не чаще раза в
+    report_interval секунд, и при остановке (stop_logging)."""
+
+    def __init__(self, queue_, report_interval: float = LOG_DROP_REPORT_INTERVAL):
+        super().__init__(queue_)
+        self.report_interval = report_interval
+        self.dropped = 0
+        self._unreported = 0
+        self._reported_at = time.monotonic()
+        self._drop_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self._unreported += 1
+            return
+
+        if self._unreported and time.monotonic() - self._reported_at >= self.report_interval:
+            summary = self.drop_summary()
+            if summary is not None:
+                try:
+                    self.queue.put_nowait(summary)
+                except queue.Full:
+                    with self._drop_lock:
+                        self._unreported += summary.args[0]
+
+    def drop_summary(self):
+        """Запись-предупреждение об отброшенных с прошлой сводки записях (None, если таких нет)"""
+        with self._drop_lock:
+            count, self._unreported = self._unreported, 0
+            self._reported_at = time.monotonic()
+        if not count:
+            return None
+        record = logging.LogRecord(logger.name, logging.WARNING, __file__, 0,
+                                   "Очередь лога переполнена: отброшено записей - %d", (count,), None)
+        record.request_id = "-"
+        return record
+
+    def prepare(self, record):
+        # Форматирование (в т.ч. трассировку) выполняет поток-слушатель
+        return record
+
+
+_listener = None
+_handler = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Настраивает корневой логгер; повторные вызовы ничего не делают"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.INFO)
+
+    _handler = handler
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи, сводку об отброшенных и останавливает поток вывода"""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        summary = _handler.drop_summary()
+        if summary is not None:
+            for output in _listener.handlers:
+                output.handle(summary)
+        _listener = None
+        _handler = None
+
+
+class RequestIdMiddleware:
+    """Назначает запросу request_id, возвращает его в X-Request-ID и пишет итог запроса в DEBUG"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s %s -> %s за %.1f мс", scope["method"], scope["path"], status,
+                             (time.perf_counter() - started) * 1000)
+            request_id_var.reset(token)
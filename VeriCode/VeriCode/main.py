@@ -1,18 +1,40 @@
-from fastapi import FastAPI, HTTPException, Depends, Request, Form
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Form, File, UploadFile
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import uvicorn
+import logging
+import os
+import functools
+import inspect
 from typing import List, Optional
-from utils import analyze_code, detect_plagiarism
+from fastapi.concurrency import run_in_threadpool
 import models, schemas, crud
-from database import SessionLocal, engine
-
-models.Base.metadata.create_all(bind=engine)
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine
+from grading import get_submission_queue, shutdown_submission_queue, QueueFullError, STATUS_QUEUED
+from migrations import upgrade_schema, pending_migrations
+from utils import plagiarism_clusters
+import passwords
+from passwords import PasswordPoolBusy, login_limiter, profile_limiter
+from pages import page_cache
+from compression import CompressionMiddleware, not_modified
+from logs import setup_logging, RequestIdMiddleware
+import user_import
+import exports
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# При нескольких узлах с общей базой миграции лучше применять отдельно:
+# python manage.py migrate, а узлы запускать с VERICODE_AUTO_MIGRATE=0
+if os.getenv("VERICODE_AUTO_MIGRATE", "1") == "1":
+    upgrade_schema(engine)
+elif pending_migrations(engine):
+    raise RuntimeError("Схема базы данных устарела, выполните: python manage.py migrate")
 
 def create_default_admin():
     db = SessionLocal()
@@ -27,7 +49,7 @@ def create_default_admin():
                 role="admin"
             )
             crud.create_user(db, admin_data)
-            print("Создан администратор по умолчанию: логин=admin, пароль=admin")
+            logger.warning("Создан администратор по умолчанию: логин=admin, пароль=admin")
     finally:
         db.close()
 
@@ -40,8 +62,64 @@ def get_db():
     finally:
         db.close()
 
+async def run_db(fn, *args, **kwargs):
+    """Выполняет fn(db, *args, **kwargs), не блокируя цикл событий.
+
+    С асинхронным драйвером запросы идут через AsyncSession.run_sync, иначе
+    функция выполняется в пуле потоков с обычной сессией. fn не должна делать
+    долгих вычислений (bcrypt и т.п.) - run_sync работает в потоке цикла событий.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(lambda db: fn(db, *args, **kwargs))
+
+    def run():
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+    return await run_in_threadpool(run)
+
+def async_db(endpoint):
+    """Превращает обработчик endpoint(..., db) в асинхронный, выполняемый через run_db.
+
+    Весь обработчик (и формирование ответа) выполняется в run_sync, то есть в потоке
+    цикла событий, поэтому декоратор - только для коротких ответов из одной-двух строк.
+    Списки и страницы остаются обычными def-обработчиками: FastAPI выполняет их в
+    пуле потоков, и загрузка строк с построением ответа не блокирует цикл событий.
+    """
+    signature = inspect.signature(endpoint)
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        return await run_db(lambda db: endpoint(*args, db=db, **kwargs))
+
+    wrapper.__signature__ = signature.replace(
+        parameters=[parameter for name, parameter in signature.parameters.items() if name != "db"]
+    )
+    return wrapper
+
 app = FastAPI()
 
+@app.on_event("startup")
+def preload_pages():
+    page_cache.preload("login.html", "register.html", "admin_dashboard.html",
+                       "teacher_dashboard.html", "student_dashboard.html")
+
+@app.on_event("shutdown")
+def shutdown_grading():
+    shutdown_submission_queue()
+
+@app.on_event("shutdown")
+def shutdown_passwords():
+    passwords.shutdown_password_pool()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
 app.add_middleware(SessionMiddleware, secret_key="vericode-secret-key")
 
 app.add_middleware(
@@ -52,6 +130,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие JSON-ответов (страницы из page_cache уже сжаты и пропускаются)
+app.add_middleware(CompressionMiddleware)
+# Последним - внешним: request_id доступен всем остальным слоям
+app.add_middleware(RequestIdMiddleware)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 def get_current_user(request: Request, db: Session = Depends(get_db)):
     user_id = request.session.get("user_id")
@@ -81,35 +164,49 @@ async def home():
     return RedirectResponse(url="/login")
 
 @app.get("/login", response_class=HTMLResponse)
-async def login_page():
-    with open("frontend/login.html", "r", encoding="utf-8") as f:
-        return f.read()
+async def login_page(request: Request):
+    return page_cache.response(request, "login.html")
 
 @app.get("/register", response_class=HTMLResponse)
-async def register_page():
-    with open("frontend/register.html", "r", encoding="utf-8") as f:
-        return f.read()
+async def register_page(request: Request):
+    return page_cache.response(request, "register.html")
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+def dashboard(request: Request, db: Session = Depends(get_db)):
     user = get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login")
 
     if user.role == "admin":
-        with open("frontend/admin_dashboard.html", "r", encoding="utf-8") as f:
-            return f.read()
+        return page_cache.response(request, "admin_dashboard.html")
     elif user.role == "teacher":
-        with open("frontend/teacher_dashboard.html", "r", encoding="utf-8") as f:
-            return f.read()
+        return page_cache.response(request, "teacher_dashboard.html")
     else:
-        with open("frontend/student_dashboard.html", "r", encoding="utf-8") as f:
-            return f.read()
+        return page_cache.response(request, "student_dashboard.html")
 @app.post("/api/login")
-async def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, username, password)
-    if not user:
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    retry_after = login_limiter.hit(username)
+    if retry_after:
+        raise HTTPException(status_code=429, detail=f"Слишком много попыток входа. Повторите через {retry_after} сек.",
+                            headers={"Retry-After": str(retry_after)})
+
+    user = await run_db(crud.get_user_by_username, username)
+    # bcrypt - в отдельном пуле, чтобы не останавливать остальные запросы
+    try:
+        valid = user is not None and await passwords.verify_password_async(password, user.password)
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте войти через несколько секунд",
+                            headers={"Retry-After": "5"})
+    if not valid:
         raise HTTPException(status_code=400, detail="Неверные учетные данные")
+    login_limiter.reset(username)
+
+    # Стоимость bcrypt изменилась - пересчитываем хеш, пока известен пароль
+    if passwords.needs_rehash(user.password):
+        try:
+            await run_db(crud.update_password_hash, user.id, await passwords.hash_password_async(password))
+        except PasswordPoolBusy:
+            pass  # пересчитаем при следующем входе
 
     # Проверяем, одобрен ли аккаунт учителя
     if user.role == "teacher" and not user.is_approved:
@@ -119,7 +216,7 @@ async def login(request: Request, username: str = Form(...), password: str = For
     return {"success": True, "role": user.role}
 
 @app.post("/api/register")
-async def register(
+def register(
     username: str = Form(...), 
     password: str = Form(...), 
     first_name: str = Form(...),
@@ -165,7 +262,8 @@ async def logout(request: Request):
     return {"success": True}
 
 @app.get("/api/current-user")
-async def current_user(request: Request, db: Session = Depends(get_db)):
+@async_db
+def current_user(request: Request, db: Session = Depends(get_db)):
     user = get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
@@ -177,18 +275,23 @@ async def current_user(request: Request, db: Session = Depends(get_db)):
         "role": user.role
     }
 @app.get("/api/assignments")
-def get_assignments(request: Request, db: Session = Depends(get_db)):
+def get_assignments(request: Request, response: Response, db: Session = Depends(get_db)):
     user = require_auth(request, db)
 
     if user.role == "teacher":
         # Учителя видят только свои задания
-        assignments = crud.get_assignments(db, teacher_id=user.id)
+        scope = {"teacher_id": user.id}
     elif user.role == "student":
         # Студенты видят только задания из групп, в которых они состоят
-        assignments = crud.get_assignments(db, user_id=user.id)
+        scope = {"user_id": user.id}
     else:
         # Админы видят все задания
-        assignments = crud.get_assignments(db)
+        scope = {}
+
+    cached = not_modified(request, response, user.id, crud.assignments_version(db, **scope))
+    if cached:
+        return cached
+    assignments = crud.get_assignments(db, **scope)
 
     return {"assignments": [
         {
@@ -205,58 +308,54 @@ class CodeSubmission(BaseModel):
     assignment_id: int
     code: str
 
-@app.post("/api/submit")
+@app.post("/api/submit", status_code=202)
 def submit_code(submission: CodeSubmission, request: Request, db: Session = Depends(get_db)):
     user = require_auth(request, db)
     if user.role != "student":
         raise HTTPException(status_code=403, detail="Только студенты могут отправлять решения")
 
+    logger.debug("Получено решение от пользователя %s для задания %s", user.username, submission.assignment_id)
+
+    # Получаем задание для проверки ожидаемого вывода и тестов
+    assignment = db.query(models.Assignment).filter(models.Assignment.id == submission.assignment_id).first()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+
+    # Проверяем дедлайн
+    if assignment.deadline:
+        from datetime import datetime, timezone
+        current_time = datetime.now(timezone.utc)
+        # Убираем информацию о часовом поясе для корректного сравнения
+        current_time_naive = current_time.replace(tzinfo=None)
+        if current_time_naive > assignment.deadline:
+            raise HTTPException(status_code=403, detail="Дедлайн для этого задания истек")
+
+    # Проверка выполняется в фоне, клиент опрашивает /api/submissions/{submission_id}
     try:
-        print(f"Получено решение от пользователя {user.username} для задания {submission.assignment_id}")
-
-        # Получаем задание для проверки ожидаемого вывода и тестов
-        assignment = db.query(models.Assignment).filter(models.Assignment.id == submission.assignment_id).first()
-        if not assignment:
-            raise HTTPException(status_code=404, detail="Задание не найдено")
-
-        # Проверяем дедлайн
-        if assignment.deadline:
-            from datetime import datetime, timezone
-            current_time = datetime.now(timezone.utc)
-            # Убираем информацию о часовом поясе для корректного сравнения
-            current_time_naive = current_time.replace(tzinfo=None)
-            if current_time_naive > assignment.deadline:
-                raise HTTPException(status_code=403, detail="Дедлайн для этого задания истек")
-
-        expected_output = assignment.expected_output
-        tests = assignment.tests
-
-        print(f"Начинаем анализ кода...")
-        result = analyze_code(submission.code, expected_output, tests)
-        print(f"Анализ кода завершен: {result}")
-
-        print(f"Проверяем плагиат...")
-        plagiarism_data = detect_plagiarism(db, submission.code, submission.assignment_id, user.id)
-        print(f"Проверка плагиата завершена: {plagiarism_data}")
-
-        print(f"Сохраняем решение...")
-        crud.save_solution(db, user.username, submission.assignment_id, submission.code, result, plagiarism_data)
-        print(f"Решение сохранено")
-
-        return {
-            "style": result["style"],
-            "errors": result["errors"],
-            "performance": result["performance"],
-            "output_check": result["output_check"],
-            "tests_passed": result.get("tests_passed", 0),
-            "total_tests": result.get("total_tests", 0),
-            "plagiarism": plagiarism_data["similar_users"] if plagiarism_data["is_plagiarized"] else "Плагиат не обнаружен"
-        }
-    except Exception as e:
-        print(f"Ошибка при обработке решения: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки: {str(e)}")
+        submission_id = get_submission_queue().submit(
+            user.id, user.username, submission.assignment_id, submission.code,
+            assignment.expected_output, assignment.tests
+        )
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте отправить решение позже")
+
+    return {"submission_id": submission_id, "status": STATUS_QUEUED}
+
+@app.get("/api/submissions/{submission_id}")
+def get_submission_status(submission_id: str, request: Request, db: Session = Depends(get_db)):
+    user = require_auth(request, db)
+
+    job = get_submission_queue().get(submission_id)
+    if not job or job["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Отправка не найдена")
+
+    return {
+        "submission_id": job["id"],
+        "assignment_id": job["assignment_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"]
+    }
 class AssignmentCreateAPI(BaseModel):
     title: str
     description: str
@@ -315,110 +414,163 @@ def update_assignment(assignment_id: int, assignment: AssignmentCreateAPI, reque
 @app.delete("/api/assignments/{assignment_id}")
 def delete_assignment(assignment_id: int, request: Request, db: Session = Depends(get_db)):
     user = require_teacher(request, db)
-    success = crud.delete_assignment(db, assignment_id, teacher_id=user.id)
-    if not success:
+    deleted = crud.delete_assignment(db, assignment_id, teacher_id=user.id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Задание не найдено или у вас нет прав на его удаление")
-    return {"success": True, "message": "Задание удалено успешно"}
+    return {"success": True, "message": "Задание удалено успешно", "deleted": deleted}
 @app.get("/api/solutions/{assignment_id}")
-def get_solutions(assignment_id: int, request: Request, db: Session = Depends(get_db)):
+def get_solutions(
+    assignment_id: int,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = crud.PAGE_SIZE,
+    is_checked: Optional[bool] = None,
+    tests_min: Optional[int] = None,
+    tests_max: Optional[int] = None,
+    username: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    user = require_teacher(request, db)
+
+    # Проверяем, что задание принадлежит этому учителю
+    assignment = db.query(models.Assignment.id).filter(
+        models.Assignment.id == assignment_id,
+        models.Assignment.teacher_id == user.id
+    ).first()
+
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Задание не найдено или у вас нет прав на просмотр решений")
+
+    cached = not_modified(request, response, user.id, crud.solutions_version(db, assignment_id=assignment_id))
+    if cached:
+        return cached
+
+    # Код и результаты тестов отдаются отдельно: /api/solution-details/{solution_id}
     try:
-        user = require_teacher(request, db)
-        print(f"Загрузка решений для задания {assignment_id} учителем {user.username}")
+        rows, next_cursor = crud.get_solution_summaries(
+            db, assignment_id, cursor=cursor, limit=limit, is_checked=is_checked,
+            tests_min=tests_min, tests_max=tests_max, username=username
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.debug("Загружено %d решений для задания %s учителем %s", len(rows), assignment_id, user.username)
 
-        # Проверяем, что задание принадлежит этому учителю
-        assignment = db.query(models.Assignment).filter(
-            models.Assignment.id == assignment_id,
-            models.Assignment.teacher_id == user.id
-        ).first()
+    return {
+        "solutions": [
+            {
+                "id": row.id,
+                "style": row.style or "",
+                "errors": row.errors or "",
+                "performance": row.performance or 0,
+                "plagiarism": row.plagiarism or "Плагиат не обнаружен",
+                "submitted_at": row.submitted_at.isoformat() if row.submitted_at else "",
+                "username": row.username or "Неизвестный пользователь",
+                "full_name": f"{row.last_name} {row.first_name}" if row.username else "Неизвестный пользователь",
+                "teacher_grade": row.teacher_grade,
+                "teacher_comment": row.teacher_comment or "",
+                "is_checked": bool(row.is_checked),
+                "checked_at": row.checked_at.isoformat() if row.checked_at else None,
+                "tests_passed": row.tests_passed or 0,
+                "total_tests": row.total_tests or 0
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
 
-        if not assignment:
-            print(f"Задание {assignment_id} не найдено для учителя {user.id}")
-            raise HTTPException(status_code=404, detail="Задание не найдено или у вас нет прав на просмотр решений")
+@app.get("/api/export/solutions")
+def export_solutions(
+    request: Request,
+    assignment_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    format: str = "csv",
+    code: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Выгрузка решений задания, группы или всех заданий учителя (без параметров) потоком"""
+    user = require_teacher(request, db)
+    if format not in exports.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный формат выгрузки: {format}")
+    if not exports.format_available(format):
+        raise HTTPException(status_code=501, detail="Выгрузка в XLSX недоступна: на сервере не установлен openpyxl")
+
+    if assignment_id is not None and not db.query(models.Assignment.id).filter(
+        models.Assignment.id == assignment_id,
+        models.Assignment.teacher_id == user.id
+    ).first():
+        raise HTTPException(status_code=404, detail="Задание не найдено или у вас нет прав на просмотр решений")
+    if group_id is not None and not db.query(models.Group.id).filter(
+        models.Group.id == group_id,
+        models.Group.teacher_id == user.id
+    ).first():
+        raise HTTPException(status_code=404, detail="Группа не найдена")
 
-        print(f"Получение решений из БД для задания {assignment_id}")
-        solutions = crud.get_solutions_for_assignment(db, assignment_id)
-        print(f"Найдено {len(solutions)} решений")
+    filename = exports.export_filename(format, code, assignment_id=assignment_id, group_id=group_id)
+    return StreamingResponse(
+        exports.stream_export(user.id, format, assignment_id=assignment_id, group_id=group_id, with_code=code),
+        media_type=exports.export_media_type(format, code),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
 
-        solutions_data = []
-        for i, s in enumerate(solutions):
-            try:
-                print(f"Обработка решения {i+1}/{len(solutions)} (ID: {s.id})")
-                
-                # Безопасное получение данных пользователя
-                username = "Неизвестный пользователь"
-                full_name = "Неизвестный пользователь"
-                try:
-                    if s.user:
-                        username = s.user.username
-                        full_name = f"{s.user.last_name} {s.user.first_name}"
-                except Exception as user_error:
-                    print(f"Ошибка получения данных пользователя для решения {s.id}: {user_error}")
-
-                solution_data = {
-                    "id": s.id,
-                    "code": str(s.code) if s.code else "",
-                    "style": str(s.style) if s.style else "",
-                    "errors": str(s.errors) if s.errors else "",
-                    "performance": int(s.performance) if s.performance else 0,
-                    "plagiarism": str(s.plagiarism) if s.plagiarism else "Плагиат не обнаружен",
-                    "submitted_at": s.submitted_at.isoformat() if s.submitted_at else "",
-                    "username": username,
-                    "full_name": full_name,
-                    "teacher_grade": int(s.teacher_grade) if s.teacher_grade else None,
-                    "teacher_comment": str(s.teacher_comment) if s.teacher_comment else "",
-                    "is_checked": bool(s.is_checked) if s.is_checked else False,
-                    "checked_at": s.checked_at.isoformat() if s.checked_at else None,
-                    "tests_passed": int(s.tests_passed) if s.tests_passed else 0,
-                    "total_tests": int(s.total_tests) if s.total_tests else 0,
-                    "test_results": str(s.test_results) if s.test_results else "[]"
-                }
-                solutions_data.append(solution_data)
-                
-            except Exception as solution_error:
-                print(f"Ошибка обработки решения {s.id}: {str(solution_error)}")
-                # Добавляем базовую информацию даже при ошибке
-                try:
-                    solutions_data.append({
-                        "id": s.id,
-                        "code": "Ошибка загрузки кода",
-                        "style": "Ошибка анализа",
-                        "errors": "Ошибка загрузки",
-                        "performance": 0,
-                        "plagiarism": "Ошибка проверки",
-                        "submitted_at": "",
-                        "username": "Ошибка загрузки",
-                        "full_name": "Ошибка загрузки",
-                        "teacher_grade": None,
-                        "teacher_comment": "",
-                        "is_checked": False,
-                        "checked_at": None,
-                        "tests_passed": 0,
-                        "total_tests": 0,
-                        "test_results": "[]"
-                    })
-                except:
-                    pass  # Пропускаем проблемное решение
-                continue
+@app.get("/api/solution-details/{solution_id}")
+@async_db
+def get_solution_details(solution_id: int, request: Request, db: Session = Depends(get_db)):
+    user = require_teacher(request, db)
 
-        print(f"Успешно обработано {len(solutions_data)} решений")
-        return {"solutions": solutions_data}
+    solution = crud.get_solution_details(db, solution_id, user.id)
+    if not solution:
+        raise HTTPException(status_code=404, detail="Решение не найдено или у вас нет прав на его просмотр")
+
+    return {
+        "id": solution.id,
+        "code": solution.code or "",
+        "test_results": solution.test_results or "[]"
+    }
+
+@app.get("/api/solutions/{assignment_id}/clusters")
+def get_plagiarism_clusters(assignment_id: int, request: Request, threshold: float = 0.6, db: Session = Depends(get_db)):
+    user = require_teacher(request, db)
+
+    assignment = db.query(models.Assignment).filter(
+        models.Assignment.id == assignment_id,
+        models.Assignment.teacher_id == user.id
+    ).first()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Задание не найдено или у вас нет прав на просмотр решений")
+
+    if not 0.3 <= threshold <= 1:
+        raise HTTPException(status_code=400, detail="Порог сходства должен быть от 0.3 до 1")
+
+    return plagiarism_clusters(db, assignment_id, round(threshold, 2))
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        error_msg = f"Критическая ошибка получения решений для задания {assignment_id}: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
-        # Возвращаем более информативную ошибку
-        raise HTTPException(status_code=500, detail="Ошибка загрузки решений. Попробуйте обновить страницу.")
 @app.get("/api/my-solutions")
-def get_my_solutions(request: Request, db: Session = Depends(get_db)):
+def get_my_solutions(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = crud.PAGE_SIZE,
+    assignment_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    is_checked: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
     user = require_auth(request, db)
     if user.role != "student":
         raise HTTPException(status_code=403, detail="Только студенты могут просматривать свои решения")
 
-    solutions = crud.get_user_solutions(db, user.id)
+    # Сводка учитывает и названия заданий, которые входят в ответ
+    cached = not_modified(request, response, user.id, crud.solutions_version(db, user_id=user.id))
+    if cached:
+        return cached
+
+    try:
+        solutions, next_cursor = crud.get_user_solutions(
+            db, user.id, cursor=cursor, limit=limit, assignment_id=assignment_id,
+            group_id=group_id, is_checked=is_checked
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "solutions": [
             {
@@ -437,7 +589,8 @@ def get_my_solutions(request: Request, db: Session = Depends(get_db)):
                 "last_modified": s.last_modified.isoformat() if s.last_modified else None
             }
             for s in solutions
-        ]
+        ],
+        "next_cursor": next_cursor
     }
 @app.post("/api/evaluate-solution")
 def evaluate_solution(evaluation: schemas.TeacherEvaluation, request: Request, db: Session = Depends(get_db)):
@@ -478,33 +631,28 @@ class GroupCreateAPI(BaseModel):
 def get_teacher_groups(request: Request, db: Session = Depends(get_db)):
     try:
         user = require_teacher(request, db)
-        print(f"Загружаем группы для учителя {user.username} (ID: {user.id})")
-        
         groups = crud.get_teacher_groups(db, user.id)
-        print(f"Получено {len(groups)} групп")
         
         groups_data = []
-        for g in groups:
+        for g, member_count in groups:
             try:
                 group_data = {
                     "id": g.id,
                     "name": g.name,
                     "description": g.description or "",
-                    "member_count": len(g.members) if g.members else 0,
+                    "member_count": member_count,
                     "created_at": g.created_at.isoformat() if g.created_at else ""
                 }
                 groups_data.append(group_data)
-            except Exception as e:
-                print(f"Ошибка обработки группы {g.id}: {str(e)}")
+            except Exception:
+                logger.warning("Ошибка обработки группы %s", g.id, exc_info=True)
                 continue
         
         return {"groups": groups_data}
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Критическая ошибка загрузки групп: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Ошибка загрузки групп")
         raise HTTPException(status_code=500, detail="Ошибка загрузки групп")
 
 @app.get("/api/student-groups")
@@ -520,19 +668,32 @@ def get_student_groups(request: Request, db: Session = Depends(get_db)):
             "name": g.name,
             "description": g.description,
             "teacher_name": f"{g.teacher.last_name} {g.teacher.first_name}",
-            "member_count": len(g.members),
+            "member_count": member_count,
             "created_at": g.created_at.isoformat()
-        } for g in groups
+        } for g, member_count in groups
     ]}
 
 @app.get("/api/all-groups")
-def get_all_groups(request: Request, db: Session = Depends(get_db)):
+def get_all_groups(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = crud.PAGE_SIZE,
+    name: Optional[str] = None,
+    available: bool = False,
+    db: Session = Depends(get_db)
+):
     user = require_auth(request, db)
     if user.role != "student":
         raise HTTPException(status_code=403, detail="Доступ только для студентов")
 
-    groups = crud.get_all_groups(db)
-    user_group_ids = [group.id for group in user.groups]
+    # available=true - только группы, в которых студент еще не состоит
+    try:
+        groups, next_cursor = crud.get_all_groups(
+            db, cursor=cursor, limit=limit, name=name, exclude_member_id=user.id if available else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    user_group_ids = crud.get_user_group_ids(db, user.id)
 
     return {"groups": [
         {
@@ -540,11 +701,11 @@ def get_all_groups(request: Request, db: Session = Depends(get_db)):
             "name": g.name,
             "description": g.description,
             "teacher_name": f"{g.teacher.last_name} {g.teacher.first_name}",
-            "member_count": len(g.members),
+            "member_count": member_count,
             "is_member": g.id in user_group_ids,
             "created_at": g.created_at.isoformat()
-        } for g in groups
-    ]}
+        } for g, member_count in groups
+    ], "next_cursor": next_cursor}
 
 @app.post("/api/groups")
 def create_group(group: GroupCreateAPI, request: Request, db: Session = Depends(get_db)):
@@ -609,6 +770,26 @@ def get_available_students(group_id: int, request: Request, db: Session = Depend
         ]
     }
 
+# Ограничение размера списков в массовых операциях
+BULK_LIMIT = 1000
+
+class GroupMembersAPI(BaseModel):
+    user_ids: List[int]
+
+class JoinRequestsAPI(BaseModel):
+    request_ids: List[int]
+
+@app.post("/api/groups/{group_id}/members")
+def add_users_to_group(group_id: int, members: GroupMembersAPI, request: Request, db: Session = Depends(get_db)):
+    user = require_teacher(request, db)
+    if not members.user_ids or len(members.user_ids) > BULK_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Укажите от 1 до {BULK_LIMIT} пользователей")
+
+    result = crud.add_users_to_group(db, members.user_ids, group_id, user.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    return {"success": True, "message": f"Добавлено в группу: {result['added']}", **result}
+
 @app.post("/api/groups/{group_id}/members/{user_id}")
 def add_user_to_group(group_id: int, user_id: int, request: Request, db: Session = Depends(get_db)):
     user = require_teacher(request, db)
@@ -683,6 +864,15 @@ def approve_group_request(request_id: int, request: Request, db: Session = Depen
         raise HTTPException(status_code=400, detail="Не удалось одобрить заявку")
     return {"success": True, "message": "Заявка одобрена"}
 
+@app.post("/api/group-requests/approve")
+def approve_group_requests(join_requests: JoinRequestsAPI, request: Request, db: Session = Depends(get_db)):
+    user = require_teacher(request, db)
+    if not join_requests.request_ids or len(join_requests.request_ids) > BULK_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Укажите от 1 до {BULK_LIMIT} заявок")
+
+    result = crud.approve_group_join_requests(db, join_requests.request_ids, user.id)
+    return {"success": True, "message": f"Одобрено заявок: {result['approved']}", **result}
+
 @app.delete("/api/group-requests/{request_id}")
 def reject_group_request(request_id: int, request: Request, db: Session = Depends(get_db)):
     user = require_teacher(request, db)
@@ -694,10 +884,10 @@ def reject_group_request(request_id: int, request: Request, db: Session = Depend
 @app.delete("/api/groups/{group_id}")
 def delete_group(group_id: int, request: Request, db: Session = Depends(get_db)):
     user = require_teacher(request, db)
-    success = crud.delete_group(db, group_id, user.id)
-    if not success:
+    deleted = crud.delete_group(db, group_id, user.id)
+    if not deleted:
         raise HTTPException(status_code=400, detail="Не удалось удалить группу или у вас нет прав")
-    return {"success": True, "message": "Группа удалена успешно"}
+    return {"success": True, "message": "Группа удалена успешно", "deleted": deleted}
 @app.get("/api/teacher-code")
 def get_teacher_code(request: Request, db: Session = Depends(get_db)):
     user = require_admin(request, db)
@@ -711,9 +901,22 @@ def update_teacher_code(new_code: str = Form(...), request: Request = Request, d
     return {"success": True, "message": "Код учителя обновлен"}
 
 @app.get("/api/all-users")
-def get_all_users(request: Request, db: Session = Depends(get_db)):
+def get_all_users(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = crud.PAGE_SIZE,
+    role: Optional[str] = None,
+    username: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     user = require_admin(request, db)
-    users = crud.get_all_users(db)
+    try:
+        # Не показываем админов
+        users, next_cursor = crud.get_all_users(
+            db, cursor=cursor, limit=limit, role=role, username=username, exclude_role="admin"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "users": [
             {
@@ -722,17 +925,30 @@ def get_all_users(request: Request, db: Session = Depends(get_db)):
                 "full_name": f"{u.last_name} {u.first_name}",
                 "role": u.role
             }
-            for u in users if u.role != "admin"  # Не показываем админов
-        ]
+            for u in users
+        ],
+        "next_cursor": next_cursor
     }
 
 @app.delete("/api/users/{user_id}")
 def delete_user(user_id: int, request: Request, db: Session = Depends(get_db)):
     user = require_admin(request, db)
-    success = crud.delete_user(db, user_id)
-    if not success:
+    deleted = crud.delete_user(db, user_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return {"success": True, "message": "Пользователь удален успешно"}
+    return {"success": True, "message": "Пользователь удален успешно", "deleted": deleted}
+
+@app.post("/api/users/import")
+def import_users(request: Request, file: UploadFile = File(...), group_id: Optional[int] = Form(None),
+                 db: Session = Depends(get_db)):
+    require_admin(request, db)
+    if group_id is not None and not crud.get_existing_group_ids(db, [group_id]):
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+
+    # Формат - по расширению файла (.json) или типу содержимого, иначе CSV
+    fmt = user_import.detect_format(file.filename, file.content_type)
+    result = user_import.import_roster(db, file.file, fmt, group_id=group_id)
+    return {"success": True, "message": f"Создано пользователей: {result['created']}, ошибок: {result['errors']}", **result}
 
 @app.get("/api/pending-teachers")
 def get_pending_teachers(request: Request, db: Session = Depends(get_db)):
@@ -775,16 +991,28 @@ class UserUpdateProfile(BaseModel):
 def update_profile(profile: UserUpdateProfile, request: Request, db: Session = Depends(get_db)):
     user = require_auth(request, db)
 
-    # Проверяем текущий пароль
-    if not crud.verify_password(profile.current_password, user.password):
-        raise HTTPException(status_code=400, detail="Неверный текущий пароль")
+    retry_after = profile_limiter.hit(user.username)
+    if retry_after:
+        raise HTTPException(status_code=429, detail=f"Слишком много попыток. Повторите через {retry_after} сек.",
+                            headers={"Retry-After": str(retry_after)})
+
+    try:
+        # Проверяем текущий пароль
+        if not crud.verify_password(profile.current_password, user.password):
+            raise HTTPException(status_code=400, detail="Неверный текущий пароль")
+        profile_limiter.reset(user.username)
+
+        new_password_hash = crud.get_password_hash(profile.new_password) if profile.new_password else None
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте через несколько секунд",
+                            headers={"Retry-After": "5"})
 
     # Обновляем данные
     user.first_name = profile.first_name
     user.last_name = profile.last_name
 
-    if profile.new_password:
-        user.password = crud.get_password_hash(profile.new_password)
+    if new_password_hash:
+        user.password = new_password_hash
 
     db.commit()
     db.refresh(user)
@@ -0,0 +1,113 @@
+"""Служебные команды: python manage.py <команда>"""
+import argparse
+import json
+import sys
+import models, crud
+from database import SessionLocal, engine
+from migrations import upgrade_schema, pending_migrations, MIGRATIONS
+from plagiarism import FINGERPRINT_VERSION
+from logs import setup_logging
+import user_import
+
+BATCH_SIZE = 500
+
+
+def backfill_fingerprints(args):
+    """Считает нормализованный AST и отпечатки для решений и истории, где их нет или они устарели"""
+    upgrade_schema(engine)
+    db = SessionLocal()
+    try:
+        for model in (models.Solution, models.SolutionHistory):
+            outdated = (model.fingerprint_version == None) | (model.fingerprint_version != FINGERPRINT_VERSION)
+            last_id = 0
+            updated = 0
+            while True:
+                batch = db.query(model).filter(outdated, model.id > last_id).order_by(model.id).limit(args.batch_size).all()
+                if not batch:
+                    break
+
+                for row in batch:
+                    if model is models.Solution:
+                        crud.store_solution_fingerprint(db, row)
+                    else:
+                        fields = crud.compute_fingerprint_fields(row.code)
+                        row.normalized_ast = fields["normalized_ast"]
+                        row.fingerprint = fields["fingerprint"]
+                        row.fingerprint_version = fields["fingerprint_version"]
+                db.commit()
+
+                last_id = batch[-1].id
+                updated += len(batch)
+            print(f"{model.__tablename__}: обновлено {updated} записей")
+    finally:
+        db.close()
+
+
+def migrate(args):
+    """Применяет новые миграции схемы базы данных"""
+    if args.status:
+        pending = {number for number, _, _ in pending_migrations(engine)}
+        for number, description, _ in MIGRATIONS:
+            print(f"{number:>3} {'ожидает ' if number in pending else 'применена'}  {description}")
+        return
+    try:
+        upgrade_schema(engine)
+    except RuntimeError as e:
+        print(f"Миграция не применена: {e}")
+        sys.exit(1)
+    print("Схема базы данных актуальна")
+
+
+def import_users(args):
+    """Создает пользователей из CSV/JSON-файла; по строке отчета на ошибку (код 1, если ошибки есть)"""
+    upgrade_schema(engine)
+    fmt = args.format or user_import.detect_format(args.path)
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as stream:
+            result = user_import.import_roster(db, stream, fmt, group_id=args.group_id)
+    finally:
+        db.close()
+
+    for line in result["rows"]:
+        if line["status"] == "error":
+            print(f"строка {line['row']}: {line.get('username') or '-'}: {line['error']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        # Без отчета сгенерированные пароли иначе потерялись бы
+        for line in result["rows"]:
+            if "password" in line:
+                print(f"{line['username']};{line['password']}")
+    print(f"Создано: {result['created']}, ошибок: {result['errors']}")
+    if result["errors"]:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды VeriCode")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help=migrate.__doc__)
+    migrate_parser.add_argument("--status", action="store_true", help="только показать примененные и ожидающие миграции")
+    migrate_parser.set_defaults(handler=migrate)
+
+    backfill = subparsers.add_parser("backfill-fingerprints", help=backfill_fingerprints.__doc__)
+    backfill.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    backfill.set_defaults(handler=backfill_fingerprints)
+
+    importer = subparsers.add_parser("import-users", help=import_users.__doc__)
+    importer.add_argument("path", help="CSV или JSON со столбцами username, password, first_name, last_name, role, group_id")
+    importer.add_argument("--format", choices=["csv", "json"], help="по умолчанию - по расширению файла")
+    importer.add_argument("--group-id", type=int, help="группа для студентов без group_id")
+    importer.add_argument("--report", help="сохранить отчет по строкам (с сгенерированными паролями) в JSON")
+    importer.set_defaults(handler=import_users)
+
+    args = parser.parse_args()
+    setup_logging()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
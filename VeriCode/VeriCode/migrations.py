@@ -0,0 +1,160 @@
+"""Версионные миграции схемы базы данных.
+
+Примененные миграции записываются в таблицу schema_version, при запуске
+выполняются только новые - по порядку, каждая в своей транзакции. Шаги
+идемпотентны (таблица, столбец или индекс создаются, только если их нет),
+поэтому старые базы без schema_version (например, educode.db) приводятся
+к текущей схеме теми же миграциями.
+
+Новая миграция - функция migrate(conn), добавленная в конец MIGRATIONS.
+"""
+import logging
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+import models
+
+logger = logging.getLogger(__name__)
+
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+# Ключ блокировки PostgreSQL: узлы, запущенные одновременно, не выполняют миграции параллельно
+_PG_LOCK_KEY = 827361
+
+
+# --------- Идемпотентные шаги ---------
+def create_table(conn, name: str):
+    models.Base.metadata.tables[name].create(conn, checkfirst=True)
+
+
+def add_column(conn, table_name: str, column_name: str):
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = models.Base.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+    logger.info("Добавлен столбец %s.%s", table_name, column_name)
+
+
+def create_index(conn, table_name: str, index_name: str):
+    existing = {index["name"] for index in inspect(conn).get_indexes(table_name)}
+    if index_name in existing:
+        return
+    table = models.Base.metadata.tables[table_name]
+    index = next(index for index in table.indexes if index.name == index_name)
+
+    if index.unique:
+        columns = list(index.columns)
+        duplicate = conn.execute(
+            select(*columns).group_by(*columns).having(func.count() > 1).limit(1)
+        ).first()
+        if duplicate:
+            # Уникальный индекс нельзя создать, пока в таблице есть дубликаты. Миграция
+            # прерывается и не записывается - после очистки она выполнится снова
+            names = ", ".join(column.name for column in columns)
+            raise RuntimeError(
+                f"Не удалось создать уникальный индекс {index_name}: в {table_name} есть строки "
+                f"с одинаковыми ({names}), например {tuple(duplicate)}. Найдите их запросом "
+                f"SELECT {names}, COUNT(*) FROM {table_name} GROUP BY {names} HAVING COUNT(*) > 1, "
+                f"оставьте по одной строке и выполните python manage.py migrate"
+            )
+
+    index.create(conn)
+    logger.info("Создан индекс %s", index_name)
+
+
+# --------- Миграции ---------
+def _baseline(conn):
+    for name in ("users", "groups", "user_groups", "assignments", "solutions",
+                 "solution_history", "group_join_requests", "settings"):
+        create_table(conn, name)
+
+
+def _fingerprints(conn):
+    for table_name in ("solutions", "solution_history"):
+        for column_name in ("normalized_ast", "fingerprint", "fingerprint_version"):
+            add_column(conn, table_name, column_name)
+    create_table(conn, "solution_fingerprints")
+
+
+def _analysis_cache(conn):
+    create_table(conn, "analysis_cache")
+
+
+def _hot_path_indexes(conn):
+    for table_name, index_name in (
+        ("users", "ix_users_role_id"),
+        ("groups", "ix_groups_name"),
+        ("groups", "ix_groups_teacher_id"),
+        ("assignments", "ix_assignments_teacher_id"),
+        ("assignments", "ix_assignments_group_id"),
+        ("solutions", "ix_solutions_assignment_submitted"),
+        ("solutions", "ix_solutions_user_submitted"),
+        ("solutions", "ux_solutions_user_assignment"),
+        ("solution_history", "ix_solution_history_solution_submitted"),
+        ("group_join_requests", "ix_group_join_requests_group_user"),
+        ("user_groups", "ix_user_groups_group_id"),
+    ):
+        create_index(conn, table_name, index_name)
+
+
+def _updated_at(conn):
+    for table_name in ("users", "groups"):
+        add_column(conn, table_name, "updated_at")
+
+
+def _unique_solutions_index(conn):
+    # Миграция 4 раньше пропускала этот индекс при дубликатах и все равно записывалась
+    create_index(conn, "solutions", "ux_solutions_user_assignment")
+
+
+MIGRATIONS = [
+    (1, "Базовая схема", _baseline),
+    (2, "Отпечатки решений для поиска плагиата", _fingerprints),
+    (3, "Кэш результатов проверки", _analysis_cache),
+    (4, "Индексы для списков и частых запросов", _hot_path_indexes),
+    (5, "Время изменения пользователей и групп", _updated_at),
+    (6, "Уникальный индекс решений студента по заданию", _unique_solutions_index),
+]
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def pending_migrations(engine) -> list:
+    with engine.connect() as conn:
+        version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def upgrade_schema(engine):
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PG_LOCK_KEY})
+            conn.commit()
+        try:
+            with conn.begin():
+                schema_version.create(conn, checkfirst=True)
+                version = current_version(conn)
+
+            for number, description, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                with conn.begin():
+                    migrate(conn)
+                    conn.execute(schema_version.insert().values(version=number, description=description))
+                logger.info("Применена миграция %d: %s", number, description)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_LOCK_KEY})
+                conn.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Table
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Table, Index, BigInteger
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -8,7 +8,9 @@ user_group_association = Table(
     'user_groups',
     Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('group_id', Integer, ForeignKey('groups.id'), primary_key=True)
+    Column('group_id', Integer, ForeignKey('groups.id'), primary_key=True),
+    # Первичный ключ начинается с user_id, участники группы ищутся по этому индексу
+    Index('ix_user_groups_group_id', 'group_id')
 )
 
 class User(Base):
@@ -22,23 +24,34 @@ class User(Base):
     role = Column(String, default="student")  # student, teacher, admin
     is_approved = Column(Boolean, default=True)  # False для учителей до одобрения админом
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())  # для ETag списков с именами
 
     solutions = relationship("Solution", back_populates="user")
     groups = relationship("Group", secondary=user_group_association, back_populates="members")
 
+    __table_args__ = (
+        # Список пользователей с фильтром по роли, постранично по id
+        Index("ix_users_role_id", "role", "id"),
+    )
+
 class Group(Base):
     __tablename__ = "groups"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(Text)
-    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Учитель, создавший группу
+    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # Учитель, создавший группу
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     teacher = relationship("User", foreign_keys=[teacher_id])
     members = relationship("User", secondary=user_group_association, back_populates="groups")
     assignments = relationship("Assignment", back_populates="group")
 
+    __table_args__ = (
+        Index("ix_groups_name", "name"),
+    )
+
 class Assignment(Base):
     __tablename__ = "assignments"
 
@@ -48,8 +61,8 @@ class Assignment(Base):
     expected_output = Column(String)
     tests = Column(Text)  # JSON строка с тестами
     deadline = Column(DateTime(timezone=True), nullable=True)  # Дедлайн для выполнения
-    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Привязка к учителю
-    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)  # Привязка к группе
+    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # Привязка к учителю
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)  # Привязка к группе
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -71,6 +84,9 @@ class Solution(Base):
     tests_passed = Column(Integer, default=0)  # Количество пройденных тестов
     total_tests = Column(Integer, default=0)   # Общее количество тестов
     test_results = Column(Text)  # JSON с результатами каждого теста
+    normalized_ast = Column(Text)  # ast.dump кода для точного сравнения при проверке плагиата
+    fingerprint = Column(Text)  # Отпечатки (хеши k-грамм через запятую)
+    fingerprint_version = Column(Integer)  # Версия алгоритма отпечатков
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
     last_modified = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -87,6 +103,14 @@ class Solution(Base):
     assignment = relationship("Assignment", back_populates="solutions")
     history = relationship("SolutionHistory", back_populates="solution")
 
+    __table_args__ = (
+        # Постраничные списки решений задания и решений студента по (submitted_at, id)
+        Index("ix_solutions_assignment_submitted", "assignment_id", "submitted_at", "id"),
+        Index("ix_solutions_user_submitted", "user_id", "submitted_at", "id"),
+        # У студента одно решение на задание (save_solution обновляет существующее)
+        Index("ux_solutions_user_assignment", "user_id", "assignment_id", unique=True),
+    )
+
 class SolutionHistory(Base):
     __tablename__ = "solution_history"
 
@@ -96,11 +120,43 @@ class SolutionHistory(Base):
     errors = Column(String)
     performance = Column(Integer)
     plagiarism = Column(String, default="Плагиат не обнаружен")
+    normalized_ast = Column(Text)
+    fingerprint = Column(Text)
+    fingerprint_version = Column(Integer)
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
 
     solution_id = Column(Integer, ForeignKey("solutions.id"))
     solution = relationship("Solution", back_populates="history")
 
+    __table_args__ = (
+        Index("ix_solution_history_solution_submitted", "solution_id", "submitted_at"),
+    )
+
+class SolutionFingerprint(Base):
+    """Инвертированный индекс отпечатков решений для поиска плагиата"""
+    __tablename__ = "solution_fingerprints"
+
+    solution_id = Column(Integer, ForeignKey("solutions.id"), primary_key=True)
+    hash = Column(BigInteger, primary_key=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_solution_fingerprints_assignment_hash", "assignment_id", "hash"),
+    )
+
+class AnalysisCache(Base):
+    """Кэш результатов analyze_code для одинакового кода и одинаковых тестов"""
+    __tablename__ = "analysis_cache"
+
+    key = Column(String, primary_key=True)  # sha256 кода (точного или его токенов), тестов и ожидаемого вывода задания
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=False, index=True)
+    code_hash = Column(String, nullable=False)  # sha256 точного кода
+    result = Column(Text, nullable=False)  # JSON результата analyze_code
+    size = Column(Integer, nullable=False)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
 class GroupJoinRequest(Base):
     __tablename__ = "group_join_requests"
 
@@ -112,6 +168,11 @@ class GroupJoinRequest(Base):
     user = relationship("User")
     group = relationship("Group")
 
+    __table_args__ = (
+        # Заявки группы и проверка "уже есть заявка" по (group_id, user_id)
+        Index("ix_group_join_requests_group_user", "group_id", "user_id"),
+    )
+
 class Settings(Base):
     __tablename__ = "settings"
 
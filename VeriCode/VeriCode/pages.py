@@ -0,0 +1,106 @@
+"""HTML-страницы интерфейса из памяти.
+
+Файлы frontend/*.html читаются и сжимаются (gzip и, если установлен пакет
+brotli, br) один раз. Ответы содержат ETag и Last-Modified, поэтому повторная
+загрузка страницы браузером получает 304 без тела. В режиме разработки
+(VERICODE_DEV=1) файл перечитывается, когда меняется его время изменения.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DIR = "frontend"
+PAGES_RELOAD = os.getenv("VERICODE_DEV", "0") == "1"
+
+
+class Page:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.mtime = os.stat(path).st_mtime
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.last_modified = formatdate(int(self.mtime), usegmt=True)
+        self.variants = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(self.body, quality=11)
+
+    def not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Любой вариант (несжатый или сжатый) - одно и то же содержимое
+            tags = {tag.strip().removeprefix("W/").strip('"').split("-")[0] for tag in if_none_match.split(",")}
+            return self.etag in tags or "*" in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def _accepted_encodings(request: Request) -> set:
+    encodings = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class PageCache:
+    def __init__(self, directory: str = FRONTEND_DIR, reload: bool = PAGES_RELOAD):
+        self.directory = directory
+        self.reload = reload
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Page:
+        page = self._pages.get(name)
+        path = os.path.join(self.directory, name)
+        if page is not None and not (self.reload and os.stat(path).st_mtime != page.mtime):
+            return page
+        with self._lock:
+            page = Page(path)
+            self._pages[name] = page
+        return page
+
+    def preload(self, *names: str):
+        for name in names:
+            self.get(name)
+
+    def response(self, request: Request, name: str) -> Response:
+        page = self.get(name)
+        headers = {
+            "Last-Modified": page.last_modified,
+            # Дашборды зависят от роли пользователя - браузер кэширует, но каждый раз проверяет
+            "Cache-Control": "private, no-cache",
+            "Vary": "Accept-Encoding, Cookie"
+        }
+
+        encoding = None
+        accepted = _accepted_encodings(request)
+        for candidate in ("br", "gzip"):
+            if candidate in accepted and candidate in page.variants:
+                encoding = candidate
+                break
+        headers["ETag"] = f'"{page.etag}-{encoding}"' if encoding else f'"{page.etag}"'
+
+        if page.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(page.variants[encoding], media_type="text/html; charset=utf-8", headers=headers)
+        return Response(page.body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+page_cache = PageCache()
@@ -0,0 +1,173 @@
+"""Хеширование и проверка паролей в отдельном ограниченном пуле.
+
+bcrypt занимает сотни миллисекунд процессора, поэтому не выполняется ни в цикле
+событий, ни в общем пуле потоков обработчиков: для него есть свой пул с
+ограниченной очередью (при переполнении - PasswordPoolBusy, ответ 503).
+Стоимость (rounds) настраивается; хеши со старой стоимостью пересчитываются
+при успешном входе. Попытки входа ограничиваются по имени пользователя.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("VERICODE_BCRYPT_ROUNDS", 12))
+# Потоки, а не процессы: bcrypt отпускает GIL
+PASSWORD_WORKERS = int(os.getenv("VERICODE_PASSWORD_WORKERS", min(4, os.cpu_count() or 2)))
+# Сколько операций может ждать в очереди пула сверх выполняющихся
+PASSWORD_QUEUE_LIMIT = int(os.getenv("VERICODE_PASSWORD_QUEUE_LIMIT", 200))
+
+# Потоки для массового хеширования при импорте пользователей
+IMPORT_HASH_WORKERS = int(os.getenv("VERICODE_IMPORT_HASH_WORKERS", os.cpu_count() or 2))
+
+LOGIN_ATTEMPTS = int(os.getenv("VERICODE_LOGIN_ATTEMPTS", 10))  # попыток на имя за окно
+LOGIN_WINDOW = int(os.getenv("VERICODE_LOGIN_WINDOW", 60))      # секунд
+
+_hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+
+
+class PasswordPoolBusy(Exception):
+    """Очередь пула паролей заполнена"""
+
+
+def _hash(password: str) -> str:
+    return _hasher.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.verify(password, hashed)
+    except ValueError:
+        return False  # в базе не bcrypt-хеш
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True, если хеш создан с другой стоимостью (или другой схемой)"""
+    try:
+        return _hasher.needs_update(hashed)
+    except ValueError:
+        return True
+
+
+class PasswordPool:
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_limit: int = PASSWORD_QUEUE_LIMIT):
+        workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="passwords")
+        self._slots = threading.BoundedSemaphore(workers + max(0, queue_limit))
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy("Слишком много одновременных операций с паролями")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_import_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_password_pool() -> PasswordPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PasswordPool()
+        return _pool
+
+
+def shutdown_password_pool():
+    global _pool, _import_pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+        if _import_pool is not None:
+            _import_pool.shutdown(wait=False, cancel_futures=True)
+            _import_pool = None
+
+
+# Блокирующие варианты - для синхронного кода (обработчики def, crud, manage.py)
+def hash_password(password: str) -> str:
+    return get_password_pool().submit(_hash, password).result()
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    return get_password_pool().submit(_verify, password, hashed).result()
+
+
+# Асинхронные варианты - для обработчиков async def
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(get_password_pool().submit(_hash, password))
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await asyncio.wrap_future(get_password_pool().submit(_verify, password, hashed))
+
+
+# Массовое хеширование (импорт пользователей) - отдельный общий пул потоков, чтобы
+# тысячи хешей не занимали пул входа
+def get_import_hash_pool() -> ThreadPoolExecutor:
+    global _import_pool
+    with _pool_lock:
+        if _import_pool is None:
+            _import_pool = ThreadPoolExecutor(max_workers=max(1, IMPORT_HASH_WORKERS),
+                                              thread_name_prefix="import-hash")
+        return _import_pool
+
+
+def hash_passwords(values: list, executor=None) -> list:
+    """Хеши списка паролей в том же порядке; с executor - параллельно в нем"""
+    if executor is None or len(values) < 2:
+        return [_hash(value) for value in values]
+    return list(executor.map(_hash, values))
+
+
+class LoginRateLimiter:
+    """Скользящее окно попыток входа по имени пользователя (в памяти процесса)"""
+
+    def __init__(self, attempts: int = LOGIN_ATTEMPTS, window: int = LOGIN_WINDOW):
+        self.attempts = attempts
+        self.window = window
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def hit(self, username: str) -> int:
+        """Учитывает попытку; возвращает 0 или через сколько секунд можно повторить"""
+        if self.attempts <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.setdefault(username.lower(), deque())
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.attempts:
+                return max(1, int(hits[0] + self.window - now) + 1)
+            hits.append(now)
+            if len(self._hits) > 10000:
+                self._prune(now)
+            return 0
+
+    def reset(self, username: str):
+        with self._lock:
+            self._hits.pop(username.lower(), None)
+
+    def _prune(self, now: float):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
+
+
+login_limiter = LoginRateLimiter()
+# Проверки текущего пароля при изменении профиля - отдельный счетчик, чтобы они
+# не блокировали вход и успешное изменение профиля не сбрасывало попытки входа
+profile_limiter = LoginRateLimiter()
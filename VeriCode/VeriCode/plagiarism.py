@@ -0,0 +1,166 @@
+"""Отпечатки кода для поиска плагиата (winnowing по k-граммам токенов AST).
+
+Код разбирается в AST, дерево превращается в поток токенов (типы узлов и
+операторов, без имен переменных и значений констант), по k-граммам считаются
+хеши, а алгоритм winnowing оставляет из каждого окна минимальный хеш.
+Общие хеши двух решений указывают на совпадающие фрагменты структуры.
+"""
+import ast
+import zlib
+
+KGRAM_SIZE = 5      # длина k-граммы в токенах
+WINNOW_WINDOW = 4   # размер окна winnowing в k-граммах
+# Версия алгоритма: при изменении нормализации или параметров выше сохраненные
+# отпечатки считаются устаревшими и пересчитываются (python manage.py backfill-fingerprints)
+FINGERPRINT_VERSION = 1
+
+
+def normalize_ast(code: str) -> str:
+    try:
+        tree = ast.parse(code)
+        return ast.dump(tree)
+    except Exception:
+        return ""
+
+
+def ast_tokens(code: str) -> list:
+    """Поток токенов нормализованного AST (обход в прямом порядке)"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+
+    tokens = []
+
+    def visit(node):
+        tokens.append(type(node).__name__)
+        if isinstance(node, ast.Constant):
+            # Значения не важны, тип константы - важен
+            tokens.append(type(node.value).__name__)
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    try:
+        visit(tree)
+    except RecursionError:
+        return []
+    return tokens
+
+
+def kgram_hashes(tokens: list, k: int = KGRAM_SIZE) -> list:
+    if len(tokens) < k:
+        return [zlib.crc32(" ".join(tokens).encode())] if tokens else []
+    return [zlib.crc32(" ".join(tokens[i:i + k]).encode()) for i in range(len(tokens) - k + 1)]
+
+
+def winnow(hashes: list, window: int = WINNOW_WINDOW) -> set:
+    """Минимальный хеш из каждого окна подряд идущих k-грамм"""
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+
+    fingerprints = set()
+    for i in range(len(hashes) - window + 1):
+        chunk = hashes[i:i + window]
+        fingerprints.add(min(chunk))
+    return fingerprints
+
+
+def fingerprint(code: str) -> set:
+    """Набор хешей-отпечатков решения (пустой, если код не разбирается)"""
+    return winnow(kgram_hashes(ast_tokens(code)))
+
+
+def encode_fingerprint(hashes: set) -> str:
+    """Компактное представление для хранения в столбце Solution.fingerprint"""
+    return ",".join(str(h) for h in sorted(hashes))
+
+
+def decode_fingerprint(value: str) -> set:
+    return {int(h) for h in value.split(",")} if value else set()
+
+
+# --------- MinHash / LSH для кластеризации всех решений задания ---------
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 полос по 4 строки: порог обнаружения пары около 0.5 по Жаккару
+_MERSENNE_PRIME = (1 << 61) - 1
+_MINHASH_SEEDS = None
+
+
+def _minhash_seeds():
+    global _MINHASH_SEEDS
+    if _MINHASH_SEEDS is None:
+        import random
+        rng = random.Random(FINGERPRINT_VERSION)  # сигнатуры воспроизводимы между запусками
+        _MINHASH_SEEDS = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(MINHASH_PERMUTATIONS)
+        ]
+    return _MINHASH_SEEDS
+
+
+def minhash_signature(hashes: set) -> tuple:
+    """MinHash-сигнатура набора отпечатков"""
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _minhash_seeds()
+    )
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_candidate_pairs(signatures: dict) -> set:
+    """Пары ключей, у которых совпала хотя бы одна полоса сигнатуры"""
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    pairs = set()
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for key, signature in signatures.items():
+            buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(key)
+        for keys in buckets.values():
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pairs.add((keys[i], keys[j]) if keys[i] < keys[j] else (keys[j], keys[i]))
+    return pairs
+
+
+def cluster_fingerprints(fingerprints: dict, threshold: float) -> list:
+    """Группирует похожие решения.
+
+    fingerprints - {id: набор отпечатков}. Кандидаты находятся через LSH, для
+    них считается точный коэффициент Жаккара; пары не ниже threshold
+    объединяются в кластеры. Возвращает список (ids, [(id1, id2, сходство)]).
+    """
+    fingerprints = {key: hashes for key, hashes in fingerprints.items() if hashes}
+    signatures = {key: minhash_signature(hashes) for key, hashes in fingerprints.items()}
+
+    parent = {key: key for key in fingerprints}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    similar_pairs = []
+    for a, b in lsh_candidate_pairs(signatures):
+        similarity = jaccard(fingerprints[a], fingerprints[b])
+        if similarity >= threshold:
+            similar_pairs.append((a, b, similarity))
+            parent[find(a)] = find(b)
+
+    clusters = {}
+    for key in fingerprints:
+        clusters.setdefault(find(key), []).append(key)
+
+    pairs_by_root = {}
+    for a, b, similarity in similar_pairs:
+        pairs_by_root.setdefault(find(a), []).append((a, b, similarity))
+
+    return [
+        (sorted(keys), sorted(pairs_by_root.get(root, []), key=lambda pair: -pair[2]))
+        for root, keys in clusters.items() if len(keys) > 1
+    ]
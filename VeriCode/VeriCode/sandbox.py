@@ -0,0 +1,713 @@
+"""Запуск кода студентов через пул заранее запущенных интерпретаторов.
+
+Каждый воркер - процесс python3 (zygote), который компилирует код один раз на
+решение и выполняет каждый ввод в отдельном дочернем процессе, полученном через
+fork. Так на каждый тест не тратится время на запуск интерпретатора.
+
+Дочерний процесс работает с ограничениями ресурсов (setrlimit: процессорное
+время, адресное пространство, число процессов, размер файлов), а его
+процессорное время и пиковая память берутся из wait4 (rusage). Вывод читается
+по частям и не больше заданного объема на поток: при превышении процесс
+завершается, а результат помечается как обрезанный.
+
+Модуль запускается как отдельный процесс (`python3 sandbox.py --zygote`), поэтому
+на верхнем уровне импортирует только стандартную библиотеку.
+"""
+import os
+import sys
+import json
+import time
+import select
+import signal
+import struct
+import threading
+import subprocess
+
+SANDBOX_PYTHON = os.getenv("VERICODE_SANDBOX_PYTHON", "python3")
+# По воркеру на каждый проверяющий поток (grading.GRADING_WORKERS), иначе решения ждут zygote
+_GRADING_WORKERS = int(os.getenv("VERICODE_GRADING_WORKERS", os.cpu_count() or 2))
+SANDBOX_WORKERS = int(os.getenv("VERICODE_SANDBOX_WORKERS", _GRADING_WORKERS))
+# Сколько запусков одного решения выполняется одновременно
+SANDBOX_PARALLEL = int(os.getenv("VERICODE_SANDBOX_PARALLEL", 4))
+# Общий предел одновременно работающих процессов студентов во всем приложении
+SANDBOX_MAX_PROCESSES = int(os.getenv("VERICODE_SANDBOX_MAX_PROCESSES", max(4, 2 * (os.cpu_count() or 2))))
+RUN_TIMEOUT = 5  # секунд на один запуск
+# Ограничения ресурсов одного запуска (0 - не ограничивать)
+SANDBOX_CPU_SECONDS = int(os.getenv("VERICODE_SANDBOX_CPU_SECONDS", RUN_TIMEOUT))
+SANDBOX_MEMORY_MB = int(os.getenv("VERICODE_SANDBOX_MEMORY_MB", 256))
+# RLIMIT_NPROC считается по всем процессам пользователя, от которого запущено приложение
+SANDBOX_NPROC = int(os.getenv("VERICODE_SANDBOX_NPROC", 256))
+SANDBOX_FILE_SIZE_KB = int(os.getenv("VERICODE_SANDBOX_FILE_SIZE_KB", 1024))
+# Сколько байт stdout/stderr сохраняется с одного запуска; при превышении процесс завершается
+SANDBOX_OUTPUT_LIMIT = int(os.getenv("VERICODE_SANDBOX_OUTPUT_LIMIT_KB", 64)) * 1024
+
+SOLUTION_FILENAME = "solution.py"
+_HEADER = struct.Struct(">I")
+
+
+class SandboxError(Exception):
+    """Воркер песочницы не смог выполнить запрос"""
+
+
+# --------- Протокол (длина + JSON) ---------
+def _write_message(fd: int, message: dict):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    data = _HEADER.pack(len(data)) + data
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def _read_exact(fd: int, size: int, deadline: float = None) -> bytes:
+    chunks = []
+    while size:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise SandboxError("Воркер песочницы не ответил вовремя")
+        chunk = os.read(fd, size)
+        if not chunk:
+            raise EOFError("Воркер песочницы завершился")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_message(fd: int, deadline: float = None) -> dict:
+    (size,) = _HEADER.unpack(_read_exact(fd, _HEADER.size, deadline))
+    return json.loads(_read_exact(fd, size, deadline).decode("utf-8"))
+
+
+def _decode(data: bytes) -> str:
+    # Как text=True в subprocess.run: универсальные переводы строк
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+
+# --------- Сторона zygote ---------
+def _set_limit(resource, name: str, soft: int, hard: int = None):
+    if not hasattr(resource, name):
+        return
+    limit = getattr(resource, name)
+    hard = soft if hard is None else hard
+    _, current_hard = resource.getrlimit(limit)
+    if current_hard != resource.RLIM_INFINITY:
+        # Поднять жесткий предел непривилегированный процесс не может
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    try:
+        resource.setrlimit(limit, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _apply_limits(limits: dict):
+    import resource
+
+    _set_limit(resource, "RLIMIT_CORE", 0)
+    if limits.get("cpu"):
+        # По мягкому пределу приходит SIGXCPU, через секунду по жесткому - SIGKILL
+        _set_limit(resource, "RLIMIT_CPU", limits["cpu"], limits["cpu"] + 1)
+    if limits.get("memory"):
+        _set_limit(resource, "RLIMIT_AS", limits["memory"] * 1024 * 1024)
+    if limits.get("nproc"):
+        _set_limit(resource, "RLIMIT_NPROC", limits["nproc"])
+    if limits.get("fsize"):
+        _set_limit(resource, "RLIMIT_FSIZE", limits["fsize"] * 1024)
+
+
+def _exec_child(code_obj, in_r: int, out_w: int, err_w: int, limits: dict):
+    """Выполняется в дочернем процессе после fork, никогда не возвращается."""
+    import builtins
+    import traceback
+
+    exit_code = 0
+    try:
+        # Своя группа процессов (для killpg), но в сессии zygote - по ней ZygoteWorker.close
+        # находит запуски, оставшиеся после смерти zygote
+        os.setpgid(0, 0)
+        _apply_limits(limits)
+        os.dup2(in_r, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.closerange(3, os.sysconf("SC_OPEN_MAX") if hasattr(os, "sysconf") else 256)
+
+        sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+        sys.stderr = open(2, "w", encoding="utf-8", closefd=False)
+        sys.argv = [SOLUTION_FILENAME]
+
+        namespace = {"__name__": "__main__", "__file__": SOLUTION_FILENAME, "__builtins__": builtins}
+        exec(code_obj, namespace)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # Пропускаем кадр самой песочницы - трассировка как у `python3 solution.py`
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(exit_code & 0xFF)
+
+
+class _Child:
+    """Запущенный через fork дочерний процесс и его потоки ввода-вывода"""
+
+    def __init__(self, code_obj, input_data: str, timeout: float, limits: dict,
+                 output_limit: int = SANDBOX_OUTPUT_LIMIT):
+        in_r, in_w = os.pipe()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+
+        self.start = time.monotonic()
+        self.pid = os.fork()
+        if self.pid == 0:
+            _exec_child(code_obj, in_r, out_w, err_w, limits)
+        try:
+            # И в родителе: killpg не должен опередить setpgid в дочернем процессе
+            os.setpgid(self.pid, self.pid)
+        except OSError:
+            pass
+
+        for fd in (in_r, out_w, err_w):
+            os.close(fd)
+
+        self.out_fd = out_r
+        self.deadline = self.start + timeout
+        self.pending_input = input_data.encode("utf-8")
+        self.write_fd = in_w
+        self.streams = {out_r: [], err_r: []}
+        self.sizes = {out_r: 0, err_r: 0}
+        self.output_limit = output_limit
+        self.truncated = False
+        self.output = {}
+        self.status = None
+        self.usage = None
+        self.timed_out = False
+        self.killed = False
+
+        os.set_blocking(in_w, False)
+        if not self.pending_input:
+            self._close_input()
+
+    def _close_input(self):
+        os.close(self.write_fd)
+        self.write_fd = None
+
+    def _close_stream(self, fd: int):
+        os.close(fd)
+        self.output[fd] = b"".join(self.streams.pop(fd))
+
+    def on_writable(self):
+        try:
+            written = os.write(self.write_fd, self.pending_input)
+            self.pending_input = self.pending_input[written:]
+        except BrokenPipeError:
+            self.pending_input = b""
+        if not self.pending_input:
+            self._close_input()
+
+    def on_readable(self, fd: int):
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            self._close_stream(fd)
+            return
+
+        room = self.output_limit - self.sizes[fd]
+        if self.output_limit and len(chunk) > room:
+            # Сверх лимита ничего не храним, процесс больше не нужен
+            self.streams[fd].append(chunk[:room])
+            self.sizes[fd] += room
+            self.truncated = True
+            self.kill(timed_out=False)
+            return
+        self.streams[fd].append(chunk)
+        self.sizes[fd] += len(chunk)
+
+    def poll(self) -> bool:
+        """True, если процесс завершился (потоки закрыты и процесс собран)."""
+        if self.status is not None:
+            return True
+        if self.streams or self.write_fd is not None:
+            return False
+        # Потоки закрыты, но процесс может продолжать работать
+        waited_pid, status, usage = os.wait4(self.pid, os.WNOHANG)
+        if waited_pid:
+            self.status = status
+            self.usage = usage
+            return True
+        return False
+
+    def kill(self, timed_out: bool = True):
+        self.timed_out = timed_out
+        self.killed = True
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        for fd in list(self.streams):
+            self._close_stream(fd)
+        if self.write_fd is not None:
+            self._close_input()
+        _, self.status, self.usage = os.wait4(self.pid, 0)
+
+    def result(self) -> dict:
+        returncode = os.waitstatus_to_exitcode(self.status)
+        stderr = _decode(b"".join(data for fd, data in self.output.items() if fd != self.out_fd))
+
+        limit_exceeded = None
+        if self.truncated:
+            limit_exceeded = "output"
+        elif returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and not self.killed):
+            limit_exceeded = "cpu"
+        elif returncode != 0 and stderr.rstrip().endswith("MemoryError"):
+            limit_exceeded = "memory"
+
+        max_rss = self.usage.ru_maxrss
+        if sys.platform == "darwin":
+            max_rss //= 1024  # на macOS ru_maxrss в байтах, в Linux - в килобайтах
+
+        return {
+            "returncode": returncode,
+            "stdout": _decode(self.output.get(self.out_fd, b"")),
+            "stderr": stderr,
+            "timed_out": self.timed_out,
+            "time_ms": int((time.monotonic() - self.start) * 1000),
+            "cpu_ms": int((self.usage.ru_utime + self.usage.ru_stime) * 1000),
+            "max_rss_kb": max_rss,
+            "limit_exceeded": limit_exceeded,
+            "truncated": self.truncated
+        }
+
+
+def _is_failure(result: dict, expected) -> bool:
+    if result["timed_out"] or result.get("limit_exceeded") == "cpu":
+        return True
+    if expected is None:
+        return False  # запуск без ожидаемого вывода (например, без ввода) не считается тестом
+    return result["returncode"] != 0 or result["stdout"].strip() != expected
+
+
+def _run_all(code_obj, request: dict) -> list:
+    """Запускает до `parallel` дочерних процессов одновременно, результаты - в порядке inputs."""
+    inputs = request["inputs"]
+    expected = request.get("expected") or [None] * len(inputs)
+    timeout = request["timeout"]
+    parallel = max(1, request.get("parallel", 1))
+    stop_on_timeout = request.get("stop_on_timeout", False)
+    max_failures = request.get("max_failures", 0)
+    limits = request.get("limits") or {}
+    output_limit = request.get("output_limit", SANDBOX_OUTPUT_LIMIT)
+
+    results = [None] * len(inputs)
+    active = {}
+    next_index = 0
+    failures = 0
+    stopped = False
+
+    while active or (not stopped and next_index < len(inputs)):
+        while not stopped and next_index < len(inputs) and len(active) < parallel:
+            active[next_index] = _Child(code_obj, inputs[next_index], timeout, limits, output_limit)
+            next_index += 1
+
+        readers = {}
+        writers = {}
+        for child in active.values():
+            for fd in child.streams:
+                readers[fd] = child
+            if child.write_fd is not None:
+                writers[child.write_fd] = child
+
+        now = time.monotonic()
+        wait = max(0, min(child.deadline for child in active.values()) - now)
+        if any(not child.streams and child.write_fd is None for child in active.values()):
+            wait = min(wait, 0.001)
+
+        if readers or writers:
+            readable, writable, _ = select.select(list(readers), list(writers), [], wait)
+            for fd in writable:
+                writers[fd].on_writable()
+            for fd in readable:
+                # Поток мог быть закрыт, если процесс уже завершен из-за лимита вывода
+                if fd in readers[fd].streams:
+                    readers[fd].on_readable(fd)
+        else:
+            time.sleep(wait)
+
+        now = time.monotonic()
+        for index, child in list(active.items()):
+            if not child.poll():
+                if now < child.deadline:
+                    continue
+                child.kill()
+            results[index] = child.result()
+            del active[index]
+
+            if _is_failure(results[index], expected[index]):
+                failures += 1
+                timed_out = results[index]["timed_out"] or results[index]["limit_exceeded"] == "cpu"
+                if (stop_on_timeout and timed_out) or (max_failures and failures >= max_failures):
+                    stopped = True
+
+        if stopped:
+            # Досрочная остановка: прерываем оставшиеся запуски
+            for index, child in list(active.items()):
+                child.kill(timed_out=False)
+                results[index] = dict(child.result(), skipped=True)
+                del active[index]
+
+    for index in range(next_index, len(inputs)):
+        results[index] = {"returncode": None, "stdout": "", "stderr": "", "timed_out": False,
+                          "time_ms": 0, "cpu_ms": 0, "max_rss_kb": 0, "limit_exceeded": None, "truncated": False,
+                          "skipped": True}
+    return results
+
+
+def _handle_request(request: dict) -> dict:
+    import linecache
+    import traceback
+
+    code = request["code"]
+    try:
+        code_obj = compile(code, SOLUTION_FILENAME, "exec")
+    except (SyntaxError, ValueError) as e:
+        error = "".join(traceback.format_exception_only(type(e), e))
+        return {"results": [
+            {"returncode": 1, "stdout": "", "stderr": error, "timed_out": False, "time_ms": 0,
+             "cpu_ms": 0, "max_rss_kb": 0, "limit_exceeded": None, "truncated": False}
+            for _ in request["inputs"]
+        ]}
+
+    # Чтобы в трассировках были строки исходного кода
+    linecache.cache[SOLUTION_FILENAME] = (len(code), None, code.splitlines(True), SOLUTION_FILENAME)
+    try:
+        results = _run_all(code_obj, request)
+    finally:
+        linecache.cache.pop(SOLUTION_FILENAME, None)
+    return {"results": results}
+
+
+def _serve():
+    # Протокол идет через исходные stdin/stdout, сами дескрипторы 0/1 отдаем /dev/null
+    proto_in = os.dup(0)
+    proto_out = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    while True:
+        try:
+            request = _read_message(proto_in)
+        except EOFError:
+            return
+        try:
+            response = _handle_request(request)
+        except Exception as e:
+            response = {"error": str(e)}
+        _write_message(proto_out, response)
+
+
+# --------- Сторона приложения ---------
+def _session_pids(sid: int) -> list:
+    """Живые процессы сессии sid (Linux, /proc; на других системах - пустой список)"""
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # После имени процесса в скобках: состояние, ppid, pgrp, session
+        fields = stat[stat.rfind(b")") + 2:].split()
+        if len(fields) > 3 and int(fields[3]) == sid and fields[0] != b"Z":
+            pids.append(int(entry))
+    return pids
+
+
+def _kill_session(sid: int):
+    # Несколько проходов: процесс студента мог успеть запустить новые
+    for _ in range(10):
+        pids = _session_pids(sid)
+        if not pids:
+            return
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+class ZygoteWorker:
+    """Один заранее запущенный интерпретатор-воркер"""
+
+    def __init__(self, python: str = SANDBOX_PYTHON):
+        # Своя сессия: ее id - pid zygote, в ней же остаются все запуски решений
+        self.process = subprocess.Popen(
+            [python, "-I", os.path.abspath(__file__), "--zygote"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            close_fds=True,
+            start_new_session=True
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, request: dict) -> list:
+        _write_message(self.process.stdin.fileno(), request)
+        # Запас на fork и сбор вывода сверх суммарного таймаута
+        rounds = -(-len(request["inputs"]) // request["parallel"])
+        deadline = time.monotonic() + request["timeout"] * max(1, rounds) + 10
+        response = _read_message(self.process.stdout.fileno(), deadline)
+        if "error" in response:
+            raise SandboxError(response["error"])
+        return response["results"]
+
+    def close(self):
+        try:
+            self.process.kill()
+            self.process.wait()
+        except Exception:
+            pass
+        # Запуски в своих группах процессов: без zygote они остались бы сиротами
+        _kill_session(self.process.pid)
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+class SandboxPool:
+    """Пул zygote-воркеров; каждый обслуживает один запрос за раз."""
+
+    def __init__(self, size: int = SANDBOX_WORKERS, python: str = SANDBOX_PYTHON,
+                 max_processes: int = SANDBOX_MAX_PROCESSES):
+        self.size = max(1, size)
+        self.python = python
+        self._idle = []  # свободные воркеры, последний освобожденный - первым
+        self._created = 0
+        # Ждущие воркера просыпаются и когда воркер вернули, и когда его убрали из пула -
+        # тогда они создают замену
+        self._available = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max(1, max_processes))
+
+    def _acquire(self) -> ZygoteWorker:
+        while True:
+            with self._available:
+                while not self._idle and self._created >= self.size:
+                    self._available.wait()
+                if self._idle:
+                    worker = self._idle.pop()
+                else:
+                    self._created += 1
+                    worker = None
+
+            if worker is None:
+                try:
+                    return ZygoteWorker(self.python)
+                except Exception:
+                    self._forget()
+                    raise
+            if worker.alive():
+                return worker
+            self._discard(worker)
+
+    def _release(self, worker: ZygoteWorker):
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _forget(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, worker: ZygoteWorker):
+        worker.close()
+        self._forget()
+
+    def _acquire_slots(self, wanted: int) -> int:
+        # Ждем хотя бы один слот, остальные берем только если свободны - без взаимных блокировок
+        self._slots.acquire()
+        acquired = 1
+        while acquired < wanted and self._slots.acquire(blocking=False):
+            acquired += 1
+        return acquired
+
+    def _release_slots(self, count: int):
+        for _ in range(count):
+            self._slots.release()
+
+    def run(self, request: dict) -> list:
+        wanted = min(request["parallel"], len(request["inputs"]))
+        # Вторая попытка - на случай, если воркер был убит (например, кодом студента)
+        for attempt in range(2):
+            # Сначала воркер, потом слоты: ожидающий zygote запрос не занимает слоты,
+            # которые работающие решения могли бы использовать для параллельных тестов
+            worker = self._acquire()
+            slots = self._acquire_slots(wanted)
+            try:
+                results = worker.request(dict(request, parallel=slots))
+            except (EOFError, OSError, SandboxError):
+                self._discard(worker)
+                if attempt:
+                    raise
+                continue
+            finally:
+                self._release_slots(slots)
+            self._release(worker)
+            return results
+
+    def close(self):
+        with self._available:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            self._discard(worker)
+
+
+def _read_capped(stream, limit: int, chunks: list, exceeded: threading.Event):
+    size = 0
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            return
+        if limit and size + len(chunk) > limit:
+            chunks.append(chunk[:limit - size])
+            exceeded.set()
+            return
+        chunks.append(chunk)
+        size += len(chunk)
+
+
+def _run_subprocess(code: str, inputs: list, timeout: float, output_limit: int = SANDBOX_OUTPUT_LIMIT) -> list:
+    """Запасной вариант без fork (например, Windows): отдельный python3 на каждый ввод.
+
+    Ограничения ресурсов и rusage здесь недоступны, лимит вывода соблюдается.
+    """
+    import tempfile
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
+        temp_file.write(code)
+        temp_file_path = temp_file.name
+
+    results = []
+    try:
+        for input_data in inputs:
+            start = time.monotonic()
+            process = subprocess.Popen(
+                [SANDBOX_PYTHON, temp_file_path],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            exceeded = threading.Event()
+            output = {"stdout": [], "stderr": []}
+            readers = [
+                threading.Thread(target=_read_capped, args=(getattr(process, name), output_limit, chunks, exceeded),
+                                 daemon=True)
+                for name, chunks in output.items()
+            ]
+            for reader in readers:
+                reader.start()
+            try:
+                process.stdin.write(input_data.encode("utf-8"))
+                process.stdin.close()
+            except OSError:
+                pass
+
+            deadline = start + timeout
+            while process.poll() is None and not exceeded.is_set() and time.monotonic() < deadline:
+                exceeded.wait(0.01)
+            timed_out = process.poll() is None and not exceeded.is_set()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            for reader in readers:
+                reader.join()
+            for stream in (process.stdout, process.stderr):
+                stream.close()
+
+            results.append({
+                "returncode": process.returncode,
+                "stdout": _decode(b"".join(output["stdout"])),
+                "stderr": _decode(b"".join(output["stderr"])),
+                "timed_out": timed_out,
+                "time_ms": int((time.monotonic() - start) * 1000),
+                "cpu_ms": None,
+                "max_rss_kb": None,
+                "limit_exceeded": "output" if exceeded.is_set() else None,
+                "truncated": exceeded.is_set()
+            })
+    finally:
+        try:
+            os.remove(temp_file_path)
+        except OSError:
+            pass
+    return results
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+        return _pool
+
+
+def run_code(code: str, inputs: list, timeout: float = RUN_TIMEOUT, expected: list = None,
+             parallel: int = SANDBOX_PARALLEL, stop_on_timeout: bool = False, max_failures: int = 0) -> list:
+    """Выполняет код с каждым вводом из inputs, результаты - в том же порядке.
+
+    Каждый результат: returncode, stdout, stderr, timed_out, time_ms (по часам),
+    cpu_ms и max_rss_kb (из rusage), limit_exceeded ("cpu", "memory", "output" или None),
+    truncated (вывод обрезан по SANDBOX_OUTPUT_LIMIT). Запуски идут
+    параллельно (не больше `parallel` на решение и SANDBOX_MAX_PROCESSES всего).
+    Если заданы expected (None - не сравнивать) и stop_on_timeout/max_failures,
+    после первого таймаута или max_failures неудач оставшиеся запуски
+    не выполняются и помечаются skipped.
+    """
+    if not inputs:
+        return []
+    if not hasattr(os, "fork"):
+        return _run_subprocess(code, inputs, timeout)
+    return get_pool().run({
+        "code": code,
+        "inputs": inputs,
+        "expected": expected,
+        "timeout": timeout,
+        "parallel": max(1, parallel),
+        "stop_on_timeout": stop_on_timeout,
+        "max_failures": max_failures,
+        "output_limit": SANDBOX_OUTPUT_LIMIT,
+        "limits": {
+            "cpu": SANDBOX_CPU_SECONDS,
+            "memory": SANDBOX_MEMORY_MB,
+            "nproc": SANDBOX_NPROC,
+            "fsize": SANDBOX_FILE_SIZE_KB
+        }
+    })
+
+
+if __name__ == "__main__" and "--zygote" in sys.argv:
+    _serve()
@@ -0,0 +1,106 @@
+import datetime
+import crud
+import models
+import utils
+
+UNLIMITED = 10 ** 9
+
+
+class FakeAnalyze:
+    """analyze_code без песочницы: считает запуски"""
+
+    def __init__(self, source_independent: bool):
+        self.source_independent = source_independent
+        self.calls = []
+
+    def __call__(self, code, expected_output, tests):
+        self.calls.append(code)
+        return {"style": utils.check_style(code), "errors": "Нет", "performance": 1, "output": "1",
+                "output_check": "Не проверялся", "tests_passed": 1, "total_tests": 1, "test_results": "[]",
+                "cacheable": True, "source_independent": self.source_independent}
+
+
+def store(db, assignment_id: int, key: str, payload: str = "", max_entries: int = UNLIMITED,
+          max_bytes: int = UNLIMITED):
+    crud.store_cached_analysis(db, key, assignment_id, key, {"output": payload}, max_entries, max_bytes)
+
+
+def age(db, keys: list):
+    """Раньше в списке - давнее использована"""
+    start = datetime.datetime(2020, 1, 1)
+    for number, key in enumerate(keys):
+        db.query(models.AnalysisCache).filter(models.AnalysisCache.key == key).update(
+            {"last_used_at": start + datetime.timedelta(minutes=number)}, synchronize_session=False)
+    db.commit()
+
+
+def cached_keys(db) -> set:
+    return {key for key, in db.query(models.AnalysisCache.key)}
+
+
+def test_eviction_by_entries(db, course):
+    assignment_id = course["assignment"].id
+    for key in "abcd":
+        store(db, assignment_id, key)
+    age(db, ["c", "a", "d", "b"])
+
+    store(db, assignment_id, "e", max_entries=3)
+
+    assert cached_keys(db) == {"d", "b", "e"}
+
+
+def test_eviction_by_bytes(db, course):
+    assignment_id = course["assignment"].id
+    for key in "abcd":
+        store(db, assignment_id, key, "x" * 100)
+    age(db, ["b", "a", "d", "c"])
+    size = db.get(models.AnalysisCache, "a").size
+
+    store(db, assignment_id, "e", "x" * 100, max_bytes=int(size * 3.5))
+
+    assert cached_keys(db) == {"d", "c", "e"}
+
+
+def test_eviction_keeps_stored_entry(db, course):
+    assignment_id = course["assignment"].id
+    store(db, assignment_id, "a")
+    age(db, ["a"])
+
+    # Обновление записи при переполнении не вытесняет ее саму
+    store(db, assignment_id, "a", "x" * 100, max_bytes=1)
+
+    assert cached_keys(db) == {"a"}
+
+
+def test_reformatted_code_reuses_result(session_factory, course):
+    assignment_id = course["assignment"].id
+    analyze = FakeAnalyze(source_independent=True)
+    code = "x = 1\nprint(x)\n"
+    reformatted = "# решение\nx  =  1\n\nprint( x )\n"
+
+    first = utils.analyze_code_cached(session_factory, assignment_id, code, None, "пусто -> 1", analyze)
+    second = utils.analyze_code_cached(session_factory, assignment_id, reformatted, None, "пусто -> 1", analyze)
+    again = utils.analyze_code_cached(session_factory, assignment_id, code, None, "пусто -> 1", analyze)
+
+    assert analyze.calls == [code]
+    # Стиль проверен для присланного текста, остальное взято из кэша
+    assert second["style"] == utils.check_style(reformatted) != first["style"]
+    assert again == first
+    assert "cacheable" not in first and "source_independent" not in first
+    # Другой код и другие тесты - новый запуск
+    utils.analyze_code_cached(session_factory, assignment_id, "x = 2\nprint(x)\n", None, "пусто -> 1", analyze)
+    utils.analyze_code_cached(session_factory, assignment_id, code, None, "пусто -> 2", analyze)
+    assert len(analyze.calls) == 3
+
+
+def test_result_with_stderr_is_keyed_on_exact_code(session_factory, course):
+    assignment_id = course["assignment"].id
+    analyze = FakeAnalyze(source_independent=False)
+    code = "print(1 / 0)\n"
+
+    utils.analyze_code_cached(session_factory, assignment_id, code, None, None, analyze)
+    utils.analyze_code_cached(session_factory, assignment_id, code, None, None, analyze)
+    utils.analyze_code_cached(session_factory, assignment_id, "\n" + code, None, None, analyze)
+
+    # Трассировка с номерами строк не переносится на код со сдвинутыми строками
+    assert analyze.calls == [code, "\n" + code]
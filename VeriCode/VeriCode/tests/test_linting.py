@@ -0,0 +1,60 @@
+import inspect
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from pyflakes import messages
+import linting
+
+# Код -> коды замечаний, которые выдает flake8
+STYLE_CASES = [
+    ("import sys  # noqa\n", []),
+    ("import sys  # noqa: F401\n", []),
+    ("import sys  # noqa: E501\n", ["F401"]),
+    # Ограниченный noqa не отключает остальные проверки pycodestyle
+    ("x = 1\nimport sys  # noqa: F401\n", ["E402"]),
+    ("x = 1\nimport sys  # noqa: E402\n", ["F401"]),
+    ("x = 1\nimport sys  # noqa\n", []),
+    ("if x == None:  # noqa: E501\n    pass\n", ["F821", "E711"]),
+    ("import os, sys\n", ["F401", "F401", "E401"]),
+    ("print('%s %s' % (1,))\n", ["F507"]),
+    ("def f():\n    x = 1\n", ["F841"]),
+]
+
+
+def style_codes(report: str) -> list:
+    return [line.split(": ", 1)[1].split()[0] for line in report.splitlines() if ": " in line]
+
+
+def without_paths(report: str) -> list:
+    # flake8 проверяет временный файл со случайным именем
+    return [line.split(":", 1)[1] for line in report.splitlines()]
+
+
+@pytest.mark.parametrize("code, expected", STYLE_CASES)
+def test_check_style_codes(code, expected):
+    assert style_codes(linting.check_style(code)) == expected
+
+
+@pytest.mark.skipif(shutil.which("flake8") is None, reason="flake8 не установлен")
+@pytest.mark.parametrize("code", [code for code, _ in STYLE_CASES])
+def test_same_as_flake8(code):
+    assert without_paths(linting._check_in_process(code)) == without_paths(linting._check_with_flake8(code))
+
+
+def test_pyflakes_codes_cover_all_messages():
+    # Новое сообщение pyflakes без кода попало бы в отчет как F999
+    names = {name for name, cls in inspect.getmembers(messages, inspect.isclass)
+             if issubclass(cls, messages.Message) and cls is not messages.Message}
+    assert names <= set(linting.PYFLAKES_CODES)
+
+
+def test_works_without_flake8():
+    # Встроенная проверка (а не запасной запуск flake8) доступна и без пакета flake8
+    script = ("import sys; sys.modules['flake8'] = None; import linting; "
+              "assert linting.pycodestyle is not None; print(linting.check_style('import os\\n'))")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(linting.__file__)))
+    assert result.returncode == 0, result.stderr
+    assert "F401 'os' imported but unused" in result.stdout
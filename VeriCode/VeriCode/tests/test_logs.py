@@ -0,0 +1,55 @@
+import logging
+import queue
+import logs
+
+
+def record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, message, None, None)
+
+
+def drain(records: queue.Queue) -> list:
+    items = []
+    while not records.empty():
+        items.append(records.get_nowait())
+    return items
+
+
+def test_dropped_records_are_reported():
+    handler = logs.DroppingQueueHandler(queue.Queue(1), report_interval=0)
+    for number in range(3):
+        handler.handle(record(f"запись {number}"))
+    assert handler.dropped == 2
+    assert [item.getMessage() for item in drain(handler.queue)] == ["запись 0"]
+
+    # Для сводки после записи места в очереди нет - отброшенные остаются неотмеченными
+    handler.handle(record("запись 3"))
+    assert [item.getMessage() for item in drain(handler.queue)] == ["запись 3"]
+    assert handler.dropped == 2
+    assert handler.drop_summary().args == (2,)
+
+
+def test_summary_follows_freed_queue():
+    handler = logs.DroppingQueueHandler(queue.Queue(2), report_interval=0)
+    for number in range(4):
+        handler.handle(record(f"запись {number}"))
+    drain(handler.queue)
+
+    handler.handle(record("запись 4"))
+
+    summary = drain(handler.queue)[-1]
+    assert summary.levelno == logging.WARNING
+    assert summary.args == (2,)
+    assert handler.drop_summary() is None
+
+
+def test_summary_waits_for_interval():
+    handler = logs.DroppingQueueHandler(queue.Queue(1), report_interval=3600)
+    handler.handle(record("запись 0"))
+    handler.handle(record("запись 1"))
+    drain(handler.queue)
+
+    handler.handle(record("запись 2"))
+
+    assert len(drain(handler.queue)) == 1
+    # Неотмеченные в логе записи попадают в сводку при остановке
+    assert handler.drop_summary().args == (1,)
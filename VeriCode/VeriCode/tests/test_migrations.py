@@ -0,0 +1,199 @@
+import threading
+import pytest
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, func,
+                        inspect, select, text)
+from sqlalchemy.pool import QueuePool
+import models
+from migrations import MIGRATIONS, _PG_LOCK_KEY, current_version, pending_migrations, schema_version, upgrade_schema
+
+LATEST = MIGRATIONS[-1][0]
+
+# Схема educode.db до миграций: без schema_version, отпечатков, кэша, индексов и updated_at
+legacy = MetaData()
+Table("users", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("username", String, unique=True, index=True, nullable=False),
+      Column("password", String, nullable=False),
+      Column("first_name", String, nullable=False),
+      Column("last_name", String, nullable=False),
+      Column("role", String),
+      Column("is_approved", Boolean),
+      Column("created_at", DateTime(timezone=True), server_default=func.now()))
+Table("groups", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("name", String, nullable=False),
+      Column("description", Text),
+      Column("teacher_id", Integer, ForeignKey("users.id"), nullable=False),
+      Column("created_at", DateTime(timezone=True), server_default=func.now()))
+Table("user_groups", legacy,
+      Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+      Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True))
+Table("assignments", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("title", String, nullable=False),
+      Column("description", Text),
+      Column("expected_output", String),
+      Column("tests", Text),
+      Column("deadline", DateTime(timezone=True)),
+      Column("teacher_id", Integer, ForeignKey("users.id"), nullable=False),
+      Column("group_id", Integer, ForeignKey("groups.id"), nullable=False),
+      Column("created_at", DateTime(timezone=True), server_default=func.now()),
+      Column("updated_at", DateTime(timezone=True)))
+Table("solutions", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("code", Text, nullable=False),
+      Column("style", String),
+      Column("errors", String),
+      Column("performance", Integer),
+      Column("plagiarism", String),
+      Column("output_check", String),
+      Column("actual_output", String),
+      Column("tests_passed", Integer),
+      Column("total_tests", Integer),
+      Column("test_results", Text),
+      Column("submitted_at", DateTime(timezone=True), server_default=func.now()),
+      Column("last_modified", DateTime(timezone=True), server_default=func.now()),
+      Column("teacher_grade", Integer),
+      Column("teacher_comment", Text),
+      Column("is_checked", Boolean),
+      Column("checked_at", DateTime(timezone=True)),
+      Column("user_id", Integer, ForeignKey("users.id")),
+      Column("assignment_id", Integer, ForeignKey("assignments.id")))
+Table("solution_history", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("code", Text, nullable=False),
+      Column("style", String),
+      Column("errors", String),
+      Column("performance", Integer),
+      Column("plagiarism", String),
+      Column("submitted_at", DateTime(timezone=True), server_default=func.now()),
+      Column("solution_id", Integer, ForeignKey("solutions.id")))
+Table("group_join_requests", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+      Column("group_id", Integer, ForeignKey("groups.id"), nullable=False),
+      Column("created_at", DateTime(timezone=True), server_default=func.now()))
+Table("settings", legacy,
+      Column("id", Integer, primary_key=True, index=True),
+      Column("key", String, unique=True, nullable=False),
+      Column("value", String, nullable=False),
+      Column("updated_at", DateTime(timezone=True), server_default=func.now()))
+
+
+def create_legacy_db(engine, solutions):
+    legacy.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(legacy.tables["users"].insert(), [
+            {"id": 1, "username": "teacher", "password": "-", "first_name": "Т", "last_name": "Т", "role": "teacher"},
+            {"id": 2, "username": "student", "password": "-", "first_name": "С", "last_name": "С", "role": "student"},
+        ])
+        conn.execute(legacy.tables["groups"].insert(), [{"id": 1, "name": "Группа", "teacher_id": 1}])
+        conn.execute(legacy.tables["user_groups"].insert(), [{"user_id": 2, "group_id": 1}])
+        conn.execute(legacy.tables["assignments"].insert(), [
+            {"id": 1, "title": "Задание", "teacher_id": 1, "group_id": 1},
+            {"id": 2, "title": "Задание 2", "teacher_id": 1, "group_id": 1},
+        ])
+        conn.execute(legacy.tables["solutions"].insert(), [
+            {"id": number, "code": f"print({number})", "user_id": 2, "assignment_id": assignment_id}
+            for number, assignment_id in enumerate(solutions, start=1)
+        ])
+
+
+def model_indexes(engine) -> set:
+    inspector = inspect(engine)
+    return {(table.name, index["name"]) for table in models.Base.metadata.sorted_tables
+            for index in inspector.get_indexes(table.name)}
+
+
+def expected_indexes() -> set:
+    return {(table.name, index.name) for table in models.Base.metadata.sorted_tables for index in table.indexes}
+
+
+def recorded_versions(engine) -> list:
+    with engine.connect() as conn:
+        return list(conn.execute(select(schema_version.c.version).order_by(schema_version.c.version)).scalars())
+
+
+def test_engine_options(engine):
+    if engine.dialect.name == "postgresql":
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool._pre_ping
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+    else:
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+
+
+def test_upgrade_empty_database(engine):
+    upgrade_schema(engine)
+
+    assert recorded_versions(engine) == [number for number, _, _ in MIGRATIONS]
+    assert set(inspect(engine).get_table_names()) >= set(models.Base.metadata.tables)
+    assert model_indexes(engine) >= expected_indexes()
+    assert pending_migrations(engine) == []
+
+    # Повторный запуск ничего не применяет
+    upgrade_schema(engine)
+    assert recorded_versions(engine) == [number for number, _, _ in MIGRATIONS]
+
+
+def test_upgrade_legacy_database(engine):
+    create_legacy_db(engine, solutions=[1, 2])
+    with engine.connect() as conn:
+        assert current_version(conn) == 0
+
+    upgrade_schema(engine)
+
+    with engine.connect() as conn:
+        assert current_version(conn) == LATEST
+        assert conn.execute(text("SELECT COUNT(*) FROM solutions")).scalar() == 2
+        assert conn.execute(text("SELECT COUNT(*) FROM user_groups")).scalar() == 1
+    columns = {column["name"] for column in inspect(engine).get_columns("solutions")}
+    assert {"normalized_ast", "fingerprint", "fingerprint_version"} <= columns
+    assert "updated_at" in {column["name"] for column in inspect(engine).get_columns("users")}
+    assert model_indexes(engine) >= expected_indexes()
+
+
+def test_duplicate_solutions_stop_migration(engine):
+    # Два решения студента 2 по заданию 1 - уникальный индекс создать нельзя
+    create_legacy_db(engine, solutions=[1, 1, 2])
+
+    with pytest.raises(RuntimeError, match="ux_solutions_user_assignment"):
+        upgrade_schema(engine)
+    # Миграции до индексов применены, миграция с индексами - нет, и индекс не создан
+    assert recorded_versions(engine) == [1, 2, 3]
+    assert ("solutions", "ux_solutions_user_assignment") not in model_indexes(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM solutions WHERE id = 2"))
+    upgrade_schema(engine)
+    assert recorded_versions(engine)[-1] == LATEST
+    assert ("solutions", "ux_solutions_user_assignment") in model_indexes(engine)
+
+
+def test_concurrent_upgrade(engine):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("блокировка миграций нужна только серверной СУБД")
+
+    errors = []
+
+    def upgrade():
+        try:
+            upgrade_schema(engine)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upgrade) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert recorded_versions(engine) == [number for number, _, _ in MIGRATIONS]
+    # Блокировка освобождена - ее может взять другое соединение
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _PG_LOCK_KEY}).scalar()
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_LOCK_KEY})
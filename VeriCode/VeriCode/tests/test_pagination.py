@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+import crud
+import models
+
+
+def all_pages(fetch, limit: int) -> list:
+    """Все строки, пройденные по курсорам страницами по limit"""
+    rows, cursor = fetch(None, limit)
+    pages = [rows]
+    while cursor:
+        rows, cursor = fetch(cursor, limit)
+        pages.append(rows)
+    assert all(len(page) == limit for page in pages[:-1])
+    return [row for page in pages for row in page]
+
+
+@pytest.fixture
+def solutions(db, course):
+    """Решения всех студентов по нескольким заданиям: часть - с одинаковым временем отправки"""
+    assignments = [course["assignment"]] + [
+        models.Assignment(title=f"Задание {number}", teacher_id=course["teacher"].id, group_id=course["group"].id)
+        for number in range(2, 6)
+    ]
+    db.add_all(assignments[1:])
+    db.flush()
+    base = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    rows = []
+    for number, assignment in enumerate(assignments):
+        for student in course["students"]:
+            # Решения первых заданий - в одну и ту же секунду, остальные - по минутам
+            submitted_at = base if number < 2 else base + timedelta(minutes=number)
+            rows.append(models.Solution(code="print(1)", user_id=student.id, assignment_id=assignment.id,
+                                        submitted_at=submitted_at))
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+def expected_order(rows) -> list:
+    return [row.id for row in sorted(rows, key=lambda row: (row.submitted_at, row.id), reverse=True)]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_user_solutions_pages(db, course, solutions, limit):
+    student = course["students"][0]
+    own = [row for row in solutions if row.user_id == student.id]
+
+    pages = all_pages(lambda cursor, size: crud.get_user_solutions(db, student.id, cursor=cursor, limit=size), limit)
+
+    assert [solution.id for solution in pages] == expected_order(own)
+
+
+@pytest.mark.parametrize("limit", [1, 2])
+def test_solution_summary_pages(db, course, solutions, limit):
+    assignment_id = course["assignment"].id
+    own = [row for row in solutions if row.assignment_id == assignment_id]
+
+    pages = all_pages(lambda cursor, size: crud.get_solution_summaries(db, assignment_id, cursor=cursor, limit=size),
+                      limit)
+
+    assert [row.id for row in pages] == expected_order(own)
+
+
+def test_server_default_timestamps(db, course):
+    # submitted_at от func.now(): в SQLite хранится без долей секунды, курсор должен это учитывать
+    student = course["students"][1]
+    assignments = [models.Assignment(title=f"Задание {number}", teacher_id=course["teacher"].id,
+                                     group_id=course["group"].id) for number in range(4)]
+    db.add_all(assignments)
+    db.flush()
+    db.add_all(models.Solution(code="print(1)", user_id=student.id, assignment_id=assignment.id)
+               for assignment in assignments)
+    db.commit()
+
+    pages = all_pages(lambda cursor, size: crud.get_user_solutions(db, student.id, cursor=cursor, limit=size), 1)
+
+    assert len({solution.id for solution in pages}) == len(assignments)
+
+
+def test_users_pages(db, course):
+    pages = all_pages(lambda cursor, size: crud.get_all_users(db, cursor=cursor, limit=size, role="student"), 2)
+
+    assert [user.id for user in pages] == sorted(student.id for student in course["students"])
+
+
+def test_broken_cursor(db, course):
+    with pytest.raises(ValueError):
+        crud.get_user_solutions(db, course["students"][0].id, cursor="не курсор")
+    with pytest.raises(ValueError):
+        crud.get_user_solutions(db, course["students"][0].id, cursor=crud.encode_cursor([1]))
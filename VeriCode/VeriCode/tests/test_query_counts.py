@@ -0,0 +1,113 @@
+"""Число SQL-запросов списков не должно зависеть от числа строк (проверка на N+1)"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import crud
+import models
+from database import SessionLocal, engine, async_engine
+from main import app
+
+PASSWORD = "password"
+
+# (кто запрашивает, адрес) - {assignment} и {group} подставляются из набора данных
+ENDPOINTS = [
+    ("teacher", "/api/groups"),
+    ("teacher", "/api/assignments"),
+    ("teacher", "/api/solutions/{assignment}"),
+    ("teacher", "/api/groups/{group}/members"),
+    ("student", "/api/student-groups"),
+    ("student", "/api/all-groups"),
+    ("student", "/api/assignments"),
+    ("student", "/api/my-solutions"),
+]
+
+
+class StatementCounter:
+    """Считает SQL-запросы, выполненные через binds внутри with"""
+
+    def __init__(self, *binds):
+        self.binds = binds
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        for bind in self.binds:
+            event.listen(bind, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for bind in self.binds:
+            event.remove(bind, "before_cursor_execute", self._record)
+
+
+def seed(prefix: str, groups: int, students: int) -> dict:
+    """Учитель с groups группами по students студентов, заданием в каждой группе и решениями.
+    Студенты состоят еще в groups группах других учителей - у каждой свой учитель."""
+    hashed = crud.get_password_hash(PASSWORD)
+    db = SessionLocal()
+    try:
+        teacher, *others = [
+            models.User(username=f"{prefix}_teacher{i}", password=hashed, first_name="Т", last_name=f"Т{i}",
+                        role="teacher") for i in range(groups + 1)
+        ]
+        users = [models.User(username=f"{prefix}_student{i}", password=hashed, first_name="С", last_name="С",
+                             role="student") for i in range(students)]
+        db.add_all([teacher] + others + users)
+        db.flush()
+        db.add_all(models.Group(name=f"{prefix} {other.username}", teacher_id=other.id, members=list(users))
+                   for other in others)
+        assignments = []
+        for number in range(groups):
+            group = models.Group(name=f"{prefix} {number}", teacher_id=teacher.id, members=list(users))
+            db.add(group)
+            db.flush()
+            assignments.append(models.Assignment(title=f"Задание {number}", teacher_id=teacher.id,
+                                                 group_id=group.id))
+        db.add_all(assignments)
+        db.flush()
+        db.add_all(models.Solution(code="print(1)", user_id=user.id, assignment_id=assignment.id)
+                   for assignment in assignments for user in users)
+        db.commit()
+        return {"teacher": teacher.username, "student": users[0].username,
+                "assignment": assignments[0].id, "group": assignments[0].group_id}
+    finally:
+        db.close()
+
+
+def login(username: str) -> TestClient:
+    client = TestClient(app)
+    response = client.post("/api/login", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return client
+
+
+@pytest.fixture(scope="module")
+def datasets():
+    small = seed("small", groups=1, students=1)
+    large = seed("large", groups=12, students=12)
+    return [
+        (data, {role: login(data[role]) for role in ("teacher", "student")})
+        for data in (small, large)
+    ]
+
+
+def count_queries(client: TestClient, path: str) -> int:
+    binds = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+    with StatementCounter(*binds) as counter:
+        response = client.get(path)
+    assert response.status_code == 200, response.text
+    return counter.count
+
+
+@pytest.mark.parametrize("role, path", ENDPOINTS)
+def test_listing_query_count_is_constant(datasets, role, path):
+    counts = [count_queries(clients[role], path.format(**data)) for data, clients in datasets]
+
+    small, large = counts
+    assert small == large, f"{path}: {small} запрос(ов) на малых данных, {large} - на больших"
@@ -0,0 +1,88 @@
+"""Горячие запросы должны находить строки по индексу, а не просмотром таблицы (EXPLAIN QUERY PLAN SQLite)"""
+import re
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import crud
+import models
+from database import create_db_engine
+from migrations import upgrade_schema
+
+HOT_QUERIES = {
+    "решение студента по заданию (save_solution)": lambda db, ids: db.query(models.Solution).filter(
+        models.Solution.user_id == ids["student"], models.Solution.assignment_id == ids["assignment"]).first(),
+    "список решений задания": lambda db, ids: crud.get_solution_summaries(db, ids["assignment"]),
+    "следующая страница решений задания": lambda db, ids: crud.get_solution_summaries(
+        db, ids["assignment"], cursor=crud.encode_cursor(["2000-01-01 00:00:00", 1])),
+    "решения студента": lambda db, ids: crud.get_user_solutions(db, ids["student"]),
+    "решения студента по заданию": lambda db, ids: crud.get_user_solutions(
+        db, ids["student"], assignment_id=ids["assignment"]),
+    "история решения": lambda db, ids: crud.get_solution_history(db, ids["solution"]),
+    "задания учителя": lambda db, ids: crud.get_assignments(db, teacher_id=ids["teacher"]),
+    "задания групп": lambda db, ids: db.query(models.Assignment).filter(
+        models.Assignment.group_id.in_([ids["group"], ids["group"] + 1])).all(),
+    "группы учителя": lambda db, ids: crud.get_teacher_groups(db, ids["teacher"]),
+    "заявки в группу": lambda db, ids: crud.get_group_join_requests(db, ids["group"]),
+    "заявка студента в группу": lambda db, ids: db.query(models.GroupJoinRequest).filter(
+        models.GroupJoinRequest.user_id == ids["student"], models.GroupJoinRequest.group_id == ids["group"]).first(),
+    "участники группы": lambda db, ids: db.query(models.User).join(
+        models.user_group_association, models.user_group_association.c.user_id == models.User.id
+    ).filter(models.user_group_association.c.group_id == ids["group"]).all(),
+}
+
+# "SCAN solutions" / "SCAN TABLE solutions" - полный просмотр таблицы без индекса
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+@pytest.fixture(scope="module")
+def seeded_engine(tmp_path_factory):
+    db_engine = create_db_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'vericode.db'}")
+    upgrade_schema(db_engine)
+    with Session(db_engine) as db:
+        teacher = models.User(username="teacher", password="-", first_name="Т", last_name="Т", role="teacher")
+        students = [models.User(username=f"student{i}", password="-", first_name="С", last_name="С",
+                                role="student") for i in range(20)]
+        db.add_all([teacher] + students)
+        db.flush()
+        groups = [models.Group(name=f"Группа {i}", teacher_id=teacher.id, members=students[i::2]) for i in range(2)]
+        db.add_all(groups)
+        db.flush()
+        assignments = [models.Assignment(title=f"Задание {i}", teacher_id=teacher.id, group_id=groups[i % 2].id)
+                       for i in range(4)]
+        db.add_all(assignments)
+        db.flush()
+        solutions = [models.Solution(code="print(1)", user_id=student.id, assignment_id=assignment.id)
+                     for assignment in assignments for student in students]
+        db.add_all(solutions)
+        db.flush()
+        db.add(models.SolutionHistory(code="print(0)", solution_id=solutions[0].id))
+        db.add(models.GroupJoinRequest(user_id=students[1].id, group_id=groups[0].id))
+        db.commit()
+        ids = {"teacher": teacher.id, "student": students[0].id, "group": groups[0].id,
+               "assignment": assignments[0].id, "solution": solutions[0].id}
+    yield db_engine, ids
+    db_engine.dispose()
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_index(seeded_engine, name):
+    db_engine, ids = seeded_engine
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("EXPLAIN"):
+            statements.append((statement, parameters))
+
+    event.listen(db_engine, "before_cursor_execute", capture)
+    try:
+        with Session(db_engine) as db:
+            HOT_QUERIES[name](db, ids)
+            assert statements
+            scans = []
+            for statement, parameters in statements:
+                plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                scans += [row[-1] for row in plan if FULL_SCAN.match(row[-1])]
+    finally:
+        event.remove(db_engine, "before_cursor_execute", capture)
+
+    assert scans == [], f"{name}: полный просмотр таблицы"
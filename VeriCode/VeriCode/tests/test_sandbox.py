@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+import pytest
+import sandbox
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork") or not os.path.isdir("/proc"),
+                                reason="zygote-воркеры и поиск процессов сессии - только Linux")
+
+# Запуск решения убивает свой zygote, оставляя работающий дочерний процесс
+KILL_ZYGOTE = """
+import os, signal, time
+if os.fork() == 0:
+    time.sleep(60)
+os.kill(os.getppid(), signal.SIGKILL)
+time.sleep(60)
+"""
+
+
+def request(code: str, inputs: list, timeout: float = 10) -> dict:
+    return {"code": code, "inputs": inputs, "expected": None, "timeout": timeout, "parallel": 1,
+            "stop_on_timeout": False, "max_failures": 0, "output_limit": sandbox.SANDBOX_OUTPUT_LIMIT,
+            "limits": {}}
+
+
+def wait_until(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_waiters_get_new_worker_after_worker_dies():
+    pool = sandbox.SandboxPool(size=1)
+    results = {}
+
+    def run(name: str, code: str):
+        try:
+            results[name] = pool.run(request(code, [""]))
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=run, args=("killer", KILL_ZYGOTE))]
+    threads += [threading.Thread(target=run, args=(f"ok{i}", f"print({i})")) for i in range(3)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        assert not any(thread.is_alive() for thread in threads), "запрос завис в ожидании воркера"
+    finally:
+        pool.close()
+
+    assert isinstance(results["killer"], Exception)
+    for i in range(3):
+        assert results[f"ok{i}"][0]["stdout"] == f"{i}\n"
+
+
+def test_close_kills_children_of_dead_zygote():
+    worker = sandbox.ZygoteWorker()
+    session = worker.process.pid
+    with pytest.raises((EOFError, sandbox.SandboxError)):
+        worker.request(request(KILL_ZYGOTE, [""]))
+    # zygote убит, его запуски живы
+    assert sandbox._session_pids(session)
+
+    worker.close()
+    assert wait_until(lambda: not sandbox._session_pids(session))
+
+
+def test_close_kills_running_children():
+    worker = sandbox.ZygoteWorker()
+    session = worker.process.pid
+    thread = threading.Thread(target=lambda: pytest.raises(Exception, worker.request,
+                                                           request("import time\ntime.sleep(60)", ["", ""], 30)))
+    thread.start()
+    try:
+        # zygote и хотя бы один запуск
+        assert wait_until(lambda: len(sandbox._session_pids(session)) > 1)
+    finally:
+        worker.close()
+        thread.join(10)
+
+    assert wait_until(lambda: not sandbox._session_pids(session))
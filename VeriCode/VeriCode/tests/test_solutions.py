@@ -0,0 +1,118 @@
+import time
+import pytest
+from sqlalchemy import event
+import crud
+import grading
+import models
+
+NO_PLAGIARISM = {"is_plagiarism": False, "similarity": 0, "similar_users": []}
+
+
+def analysis_result(code: str, tests_passed: int = 1) -> dict:
+    return {
+        "style": "Замечаний нет",
+        "errors": "Нет",
+        "performance": 10,
+        "output": code,
+        "output_check": "Не проверялся",
+        "tests_passed": tests_passed,
+        "total_tests": 2,
+        "test_results": "[]",
+        "cacheable": True
+    }
+
+
+def wait_for(queue, job_id: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (grading.STATUS_DONE, grading.STATUS_FAILED):
+            return job
+        time.sleep(0.02)
+    pytest.fail(f"Проверка {job_id} не завершилась за {timeout} с")
+
+
+def test_save_solution_resubmission(db, course):
+    student = course["students"][0]
+    assignment_id = course["assignment"].id
+
+    first = crud.save_solution(db, student.username, assignment_id, "print(1)", analysis_result("1"), NO_PLAGIARISM)
+    crud.update_solution_grade(db, first.id, 5, "Хорошо")
+    second = crud.save_solution(db, student.username, assignment_id, "print(2)", analysis_result("2", 2),
+                                NO_PLAGIARISM)
+
+    assert second.id == first.id
+    assert second.code == "print(2)"
+    assert second.tests_passed == 2
+    # Новая отправка сбрасывает оценку, прежний код уходит в историю
+    assert second.teacher_grade is None and not second.is_checked
+    assert [entry.code for entry in crud.get_solution_history(db, first.id)] == ["print(1)"]
+    assert db.query(models.SolutionFingerprint).filter(
+        models.SolutionFingerprint.solution_id == first.id).count() > 0
+
+
+def test_submission_queue_saves_solution(monkeypatch, session_factory, db, course):
+    monkeypatch.setattr(grading, "SessionLocal", session_factory)
+    monkeypatch.setattr(grading, "analyze_code", lambda code, expected_output, tests: analysis_result(code))
+    student = course["students"][1]
+    assignment_id = course["assignment"].id
+    queue = grading.SubmissionQueue(workers=2)
+    try:
+        job = wait_for(queue, queue.submit(student.id, student.username, assignment_id, "print(42)"))
+    finally:
+        queue.shutdown()
+
+    assert job["status"] == grading.STATUS_DONE, job["error"]
+    solution = db.get(models.Solution, job["result"]["solution_id"])
+    assert (solution.user_id, solution.assignment_id, solution.code) == (student.id, assignment_id, "print(42)")
+    assert job["result"]["plagiarism"] == "Плагиат не обнаружен"
+    # Результат анализа попал в кэш
+    assert db.query(models.AnalysisCache).filter(models.AnalysisCache.assignment_id == assignment_id).count() == 1
+
+
+def test_submission_queue_serializes_resubmissions(monkeypatch, session_factory, db, course):
+    def slow_analyze(code, expected_output, tests):
+        time.sleep(0.2)
+        return analysis_result(code)
+
+    monkeypatch.setattr(grading, "SessionLocal", session_factory)
+    monkeypatch.setattr(grading, "analyze_code", slow_analyze)
+    student = course["students"][2]
+    assignment_id = course["assignment"].id
+    queue = grading.SubmissionQueue(workers=4)
+    try:
+        job_ids = [queue.submit(student.id, student.username, assignment_id, f"print({i})") for i in range(3)]
+        jobs = [wait_for(queue, job_id) for job_id in job_ids]
+    finally:
+        queue.shutdown()
+
+    assert [job["status"] for job in jobs] == [grading.STATUS_DONE] * 3, [job["error"] for job in jobs]
+    solutions = db.query(models.Solution).filter(models.Solution.user_id == student.id,
+                                                 models.Solution.assignment_id == assignment_id).all()
+    assert len(solutions) == 1
+    # Последней сохранена последняя отправка, предыдущие - в истории
+    assert solutions[0].code == "print(2)"
+    assert [entry.code for entry in crud.get_solution_history(db, solutions[0].id)] in (["print(0)", "print(1)"], ["print(1)", "print(0)"])
+
+
+def test_save_solution_inserted_concurrently(session_factory, db, course):
+    student = course["students"][0]
+    assignment_id = course["assignment"].id
+
+    # Другой процесс вставляет решение между проверкой наличия и вставкой
+    @event.listens_for(db, "before_flush", once=True)
+    def insert_concurrently(session, flush_context, instances):
+        other = session_factory()
+        try:
+            crud.save_solution(other, student.username, assignment_id, "print(1)", analysis_result("1"),
+                               NO_PLAGIARISM)
+        finally:
+            other.close()
+
+    solution = crud.save_solution(db, student.username, assignment_id, "print(2)", analysis_result("2"),
+                                  NO_PLAGIARISM)
+
+    assert solution.code == "print(2)"
+    assert db.query(models.Solution).filter(models.Solution.user_id == student.id,
+                                            models.Solution.assignment_id == assignment_id).count() == 1
+    assert [entry.code for entry in crud.get_solution_history(db, solution.id)] == ["print(1)"]
@@ -0,0 +1,209 @@
+"""Массовый импорт пользователей из CSV или JSON (POST /api/users/import и manage.py import-users).
+
+Файл читается потоком и обрабатывается пакетами: проверка строк, один запрос
+на уже занятые логины, хеширование паролей параллельно в пуле потоков,
+вставка пакета одним executemany, членство в группах одним INSERT и commit
+на пакет. Результат - отчет по каждой строке.
+
+Столбцы: username, password (пустой - пароль генерируется и возвращается в
+отчете), first_name, last_name, role (student или teacher, по умолчанию
+student), group_id (только для студентов; по умолчанию - группа из запроса).
+"""
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import secrets
+from concurrent.futures import BrokenExecutor
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import crud
+import passwords
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("VERICODE_IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_ROWS = int(os.getenv("VERICODE_IMPORT_MAX_ROWS", 20000))
+IMPORT_ROLES = ("student", "teacher")
+REQUIRED_FIELDS = ("username", "first_name", "last_name")
+
+
+def detect_format(filename: str = None, content_type: str = None) -> str:
+    if (filename or "").lower().endswith((".json", ".jsonl")) or "json" in (content_type or ""):
+        return "json"
+    return "csv"
+
+
+def read_roster(stream, fmt: str = "csv"):
+    """Строки файла (бинарного потока) как словари"""
+    if fmt == "json":
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get("users")
+        if not isinstance(data, list):
+            raise ValueError("Ожидается JSON-массив пользователей или объект с полем users")
+        yield from data
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    header = text.readline()
+    # Excel с русской локалью сохраняет CSV через ";"
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+    missing = [field for field in REQUIRED_FIELDS if field not in [name.strip().lower() for name in reader.fieldnames or []]]
+    if missing:
+        raise ValueError(f"В CSV нет столбцов: {', '.join(missing)}")
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise ValueError(f"Ошибка CSV: {e}")
+
+
+def _normalize(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise ValueError("Строка должна быть объектом")
+    return {str(key).strip().lower(): "" if value is None else str(value).strip()
+            for key, value in raw.items() if key is not None}
+
+
+def _validate(raw, default_group_id: int, seen: set) -> dict:
+    """Проверенная запись строки; ValueError с текстом ошибки для отчета"""
+    row = _normalize(raw)
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise ValueError(f"Не заполнены поля: {', '.join(missing)}")
+
+    username = row["username"]
+    if username.lower() in seen:
+        raise ValueError("Логин повторяется в файле")
+    seen.add(username.lower())
+
+    role = row.get("role") or "student"
+    if role not in IMPORT_ROLES:
+        raise ValueError(f"Недопустимая роль: {role}")
+
+    group_id = default_group_id
+    if row.get("group_id"):
+        try:
+            group_id = int(row["group_id"])
+        except ValueError:
+            raise ValueError(f"Некорректный group_id: {row['group_id']}")
+    if role != "student":
+        if row.get("group_id"):
+            raise ValueError("Группа назначается только студентам")
+        group_id = None
+
+    return {
+        "username": username,
+        "password": row.get("password") or None,
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "role": role,
+        "group_id": group_id
+    }
+
+
+def _import_batch(db: Session, batch: list, report: list, executor):
+    existing = crud.get_existing_usernames(db, [entry["username"] for _, entry in batch])
+    group_ids = crud.get_existing_group_ids(db, {entry["group_id"] for _, entry in batch if entry["group_id"]})
+
+    fresh = []
+    for number, entry in batch:
+        if entry["username"] in existing:
+            report.append({"row": number, "username": entry["username"], "status": "error",
+                           "error": "Пользователь уже существует"})
+        elif entry["group_id"] and entry["group_id"] not in group_ids:
+            report.append({"row": number, "username": entry["username"], "status": "error",
+                           "error": f"Группа {entry['group_id']} не найдена"})
+        else:
+            fresh.append((number, entry))
+    if not fresh:
+        return
+
+    generated = {}
+    for number, entry in fresh:
+        if not entry["password"]:
+            entry["password"] = generated[number] = secrets.token_urlsafe(9)
+    try:
+        hashes = passwords.hash_passwords([entry["password"] for _, entry in fresh], executor)
+    except (BrokenExecutor, RuntimeError) as e:
+        # Пул хеширования недоступен (например, остановлен при завершении сервера)
+        logger.error("Не удалось захешировать пароли пакета импорта: %s", e)
+        for number, entry in fresh:
+            report.append({"row": number, "username": entry["username"], "status": "error",
+                           "error": "Не удалось захешировать пароль, повторите импорт этих строк"})
+        return
+
+    try:
+        ids = crud.insert_users(db, [
+            {
+                "username": entry["username"],
+                "password": hashed,
+                "first_name": entry["first_name"],
+                "last_name": entry["last_name"],
+                "role": entry["role"],
+                # Импортирует администратор - учителя сразу одобрены
+                "is_approved": True
+            }
+            for (_, entry), hashed in zip(fresh, hashes)
+        ])
+        crud.insert_group_memberships(db, [
+            (ids[entry["username"]], entry["group_id"]) for _, entry in fresh if entry["group_id"]
+        ])
+        db.commit()
+    except IntegrityError as e:
+        # Логин заняли параллельно - пакет не вставлен целиком
+        db.rollback()
+        logger.warning("Пакет импорта пользователей отклонен: %s", e.orig)
+        for number, entry in fresh:
+            report.append({"row": number, "username": entry["username"], "status": "error",
+                           "error": "Конфликт при вставке пакета, повторите импорт этих строк"})
+        return
+
+    for number, entry in fresh:
+        line = {"row": number, "username": entry["username"], "status": "created",
+                "id": ids[entry["username"]], "role": entry["role"], "group_id": entry["group_id"]}
+        if number in generated:
+            line["password"] = generated[number]
+        report.append(line)
+
+
+def import_users(db: Session, rows, group_id: int = None, batch_size: int = IMPORT_BATCH_SIZE,
+                 max_rows: int = IMPORT_MAX_ROWS, executor=None) -> dict:
+    """Импортирует строки rows пакетами по batch_size; отчет {"created", "errors", "rows"}"""
+    report = []
+    seen = set()
+    batch = []
+    number = 0
+    try:
+        for number, raw in enumerate(rows, start=1):
+            if number > max_rows:
+                report.append({"row": number, "status": "error",
+                               "error": f"Превышено число строк ({max_rows}), остальные не импортированы"})
+                break
+            try:
+                batch.append((number, _validate(raw, group_id, seen)))
+            except ValueError as e:
+                username = raw.get("username") if isinstance(raw, dict) else None
+                report.append({"row": number, "username": username, "status": "error", "error": str(e)})
+                continue
+            if len(batch) >= batch_size:
+                _import_batch(db, batch, report, executor)
+                batch = []
+    except ValueError as e:  # в т.ч. JSONDecodeError и UnicodeDecodeError
+        report.append({"row": number + 1, "status": "error", "error": f"Ошибка чтения файла: {e}"})
+    if batch:
+        _import_batch(db, batch, report, executor)
+
+    report.sort(key=lambda line: line["row"])
+    created = sum(1 for line in report if line["status"] == "created")
+    logger.info("Импорт пользователей: создано %d, ошибок %d", created, len(report) - created)
+    return {"created": created, "errors": len(report) - created, "rows": report}
+
+
+def import_roster(db: Session, stream, fmt: str = "csv", group_id: int = None) -> dict:
+    """Импорт из бинарного потока с хешированием паролей в общем пуле импорта"""
+    return import_users(db, read_roster(stream, fmt), group_id=group_id,
+                        executor=passwords.get_import_hash_pool())
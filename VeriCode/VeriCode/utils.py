@@ -1,66 +1,93 @@
-import time
-import ast
-import tempfile
+import io
 import os
 import json
-import subprocess
+import hashlib
+import tokenize
+import threading
+from collections import OrderedDict
 from difflib import SequenceMatcher
 from sqlalchemy.orm import Session
-import models
-
-def analyze_code(code: str, expected_output: str = None, tests: str = None):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".py", mode='w') as temp:
-        temp.write(code)
-        temp_path = temp.name
-
+from sqlalchemy.sql import func
+import models, crud
+from sandbox import run_code, RUN_TIMEOUT, SANDBOX_OUTPUT_LIMIT
+from linting import check_style as lint_code
+from plagiarism import fingerprint, normalize_ast, decode_fingerprint, cluster_fingerprints, FINGERPRINT_VERSION
+
+# Досрочная остановка тестов: после первого таймаута и/или после N неудач (0 - выключено)
+TESTS_STOP_ON_TIMEOUT = os.getenv("VERICODE_TESTS_STOP_ON_TIMEOUT", "0") == "1"
+TESTS_MAX_FAILURES = int(os.getenv("VERICODE_TESTS_MAX_FAILURES", 0))
+
+# Сколько лучших кандидатов из индекса отпечатков сравнивать точно
+PLAGIARISM_TOP_K = int(os.getenv("VERICODE_PLAGIARISM_TOP_K", 10))
+# Минимальная доля общих отпечатков, чтобы решение стало кандидатом
+PLAGIARISM_MIN_OVERLAP = 0.3
+
+# Версия формата кэшированных результатов анализа (увеличить при изменении analyze_code)
+ANALYSIS_CACHE_VERSION = 3
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("VERICODE_ANALYSIS_CACHE_MAX_ENTRIES", 5000))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("VERICODE_ANALYSIS_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+
+# Отчеты о кластерах плагиата: {(assignment_id, порог): (версия набора решений, отчет)},
+# давно не запрошенные вытесняются сверх CLUSTERS_CACHE_SIZE (кэш свой у каждого процесса)
+CLUSTERS_CACHE_SIZE = int(os.getenv("VERICODE_CLUSTERS_CACHE_SIZE", 64))
+_clusters_cache = OrderedDict()
+_clusters_cache_lock = threading.Lock()
+
+def check_style(code: str) -> str:
     try:
-        result = subprocess.run(["flake8", temp_path], capture_output=True, text=True)
-        style_issues = result.stdout.strip()
+        style_issues = lint_code(code)
     except Exception as e:
         style_issues = f"Ошибка flake8: {e}"
 
+    return style_issues if style_issues else "Замечаний нет"
+
+def analyze_code(code: str, expected_output: str = None, tests: str = None,
+                 stop_on_timeout: bool = TESTS_STOP_ON_TIMEOUT, max_failures: int = TESTS_MAX_FAILURES):
+    style = check_style(code)
+
     runtime_error = "Нет"
     actual_output = ""
     output_check = "Не проверялся"
     tests_passed = 0
     total_tests = 0
     test_results_json = "[]"
+    performance = 0
+    # Результат можно переиспользовать для того же кода, если проверка не упала и не было таймаутов
+    cacheable = True
+    # ...и для кода, отличающегося только форматированием, если ни один запуск ничего не вывел
+    # в stderr: трассировки и предупреждения содержат номера и текст строк исходника
+    source_independent = False
 
     try:
-        start = time.time()
-
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-            temp_file.write(code)
-            temp_file_path = temp_file.name
-
-        try:
-            result = subprocess.run(
-                ["python3", temp_file_path],
-                capture_output=True,
-                text=True,
-                timeout=5,
-                input=""
-            )
-
-            if result.returncode != 0:
-                runtime_error = result.stderr.strip()
-            else:
-                actual_output = result.stdout.strip()
-
-            try:
-                os.remove(temp_file_path)
-            except:
-                pass
-
-        except subprocess.TimeoutExpired:
+        test_cases = parse_tests(tests) if tests else []
+
+        # Код компилируется один раз: запуск без ввода и все тесты - одним запросом к песочнице
+        runs = run_code(
+            code,
+            [""] + [_test_stdin(case) for case in test_cases],
+            timeout=RUN_TIMEOUT,
+            expected=[None] + [case["expected"] for case in test_cases],
+            stop_on_timeout=stop_on_timeout,
+            max_failures=max_failures
+        )
+        bare_run = runs[0]
+
+        if bare_run["timed_out"]:
             runtime_error = "Превышено время выполнения (5 секунд)"
-        except Exception as e:
-            runtime_error = str(e)
-        finally:
-            performance = int((time.time() - start) * 1000)
-
-        if tests:
-            test_results = run_tests(code, tests)
+        elif bare_run.get("limit_exceeded") == "cpu":
+            runtime_error = "Превышен лимит процессорного времени"
+        elif bare_run.get("limit_exceeded") == "output":
+            runtime_error = f"Превышен объем вывода ({SANDBOX_OUTPUT_LIMIT // 1024} КБ), выполнение остановлено"
+        elif bare_run["returncode"] != 0:
+            runtime_error = bare_run["stderr"].strip()
+        else:
+            actual_output = bare_run["stdout"].strip()
+        performance = run_performance(runs[1:] if test_cases else runs)
+        cacheable = not any(run["timed_out"] or run.get("limit_exceeded") == "cpu" for run in runs)
+        source_independent = not any(run.get("stderr") for run in runs)
+
+        if test_cases:
+            test_results = build_test_results(test_cases, runs[1:])
             tests_passed = test_results["tests_passed"]
             total_tests = test_results["total_tests"]
             test_results_json = test_results["test_results"]
@@ -68,154 +95,242 @@ def analyze_code(code: str, expected_output: str = None, tests: str = None):
     except Exception as e:
         runtime_error = str(e)
         performance = 0
-
-    try:
-        os.remove(temp_path)
-    except:
-        pass
+        cacheable = False
 
     return {
-        "style": style_issues if style_issues else "Замечаний нет",
+        "style": style,
         "errors": runtime_error,
         "performance": performance,
         "output": actual_output,
         "output_check": output_check,
         "tests_passed": tests_passed,
         "total_tests": total_tests,
-        "test_results": test_results_json
+        "test_results": test_results_json,
+        "cacheable": cacheable,
+        "source_independent": source_independent
     }
 
-def run_tests(code, tests):
-    test_lines = [line.strip() for line in tests.split('\n') if line.strip()]
+def _code_tokens(code: str) -> str:
+    """Поток токенов кода без комментариев, пустых строк и отступов-пробелов;
+    код, который не разбирается на токены, возвращается как есть"""
+    skip = (tokenize.COMMENT, tokenize.NL, tokenize.ENCODING)
+    try:
+        tokens = [
+            (token.type, "" if token.type in (tokenize.INDENT, tokenize.NEWLINE) else token.string)
+            for token in tokenize.generate_tokens(io.StringIO(code).readline)
+            if token.type not in skip
+        ]
+    except (tokenize.TokenError, SyntaxError, ValueError):
+        return code
+    return "\n".join(f"{token_type} {string}" for token_type, string in tokens)
+
+def analysis_cache_key(code: str, expected_output: str = None, tests: str = None, normalized: bool = False) -> str:
+    """Ключ кэша результатов: код + тесты и ожидаемый вывод задания.
+
+    normalized=True - ключ по токенам кода: комментарии, пустые строки и пробелы
+    не влияют. Под ним хранятся только результаты без stderr - в остальных есть
+    номера и текст строк исходника, и они хранятся под ключом точного кода."""
+    digest = hashlib.sha256()
+    source = ("tokens", _code_tokens(code)) if normalized else ("source", code)
+    for part in (ANALYSIS_CACHE_VERSION, *source, expected_output or "", tests or ""):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+def analyze_code_cached(session_factory, assignment_id: int, code: str, expected_output: str = None,
+                        tests: str = None, analyze=analyze_code):
+    """analyze_code с кэшем в БД: повторная отправка того же кода (или того же кода в
+    другом форматировании) не запускается заново.
+
+    session_factory (например, SessionLocal) открывает короткие сессии для чтения и
+    записи кэша: на время анализа (секунды запусков в песочнице) соединение с базой
+    не удерживается.
+    """
+    exact_key = analysis_cache_key(code, expected_output, tests)
+    tokens_key = analysis_cache_key(code, expected_output, tests, normalized=True)
+    current_hash = code_hash(code)
+
+    cached = None
+    with session_factory() as db:
+        for key in (exact_key, tokens_key):
+            entry = crud.get_cached_analysis(db, key)
+            if entry:
+                cached = json.loads(entry.result)
+                restyle = entry.code_hash != current_hash
+                break
+    if cached is not None:
+        # Стиль зависит от форматирования - для другого текста кода проверяем заново
+        if restyle:
+            cached["style"] = check_style(code)
+        return cached
+
+    result = analyze(code, expected_output, tests)
+    # Признаки "cacheable" и "source_independent" нужны только здесь и вызывающим не возвращаются
+    source_independent = result.pop("source_independent", False)
+    if result.pop("cacheable", False):
+        key = tokens_key if source_independent else exact_key
+        with session_factory() as db:
+            crud.store_cached_analysis(db, key, assignment_id, current_hash, result,
+                                       ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES)
+    return result
+
+def parse_tests(tests: str):
+    """Разбирает строки тестов вида `ввод -> ожидаемый вывод`"""
+    test_cases = []
+    for test_line in (line.strip() for line in tests.split('\n')):
+        if not test_line:
+            continue
+
+        if " -> " in test_line:
+            input_part, expected_output = test_line.split(" -> ", 1)
+            input_data = input_part.strip()
+            expected_output = expected_output.strip()
+
+            if input_data.lower() == "пусто":
+                input_data = ""
+        else:
+            expected_output = ""
+            input_data = test_line.strip()
+
+        test_cases.append({"test": test_line, "input": input_data, "expected": expected_output})
+    return test_cases
+
+def _test_stdin(case: dict) -> str:
+    return case["input"].replace(" ", "\n") if case["input"] else ""
+
+def run_performance(runs: list) -> int:
+    """Суммарное процессорное время выполненных запусков, мс (по часам - если rusage недоступен)"""
+    total = 0
+    for run in runs:
+        if run.get("skipped"):
+            continue
+        cpu_ms = run.get("cpu_ms")
+        total += cpu_ms if cpu_ms is not None else run.get("time_ms", 0)
+    return total
+
+def build_test_results(test_cases: list, runs: list):
     test_results = []
     tests_passed = 0
 
-    for i, test_line in enumerate(test_lines):
-        test_name = f"Тест {i + 1}"
-
-        try:
-            if " -> " in test_line:
-                input_part, expected_output = test_line.split(" -> ", 1)
-                input_data = input_part.strip()
-                expected_output = expected_output.strip()
-
-                if input_data.lower() == "пусто":
-                    input_data = ""
+    for i, (case, run) in enumerate(zip(test_cases, runs)):
+        entry = {
+            "name": f"Тест {i + 1}",
+            "passed": False,
+            "test": case["test"],
+            "input": case["input"] if case["input"] else "(без ввода)",
+            "expected": case["expected"],
+            "actual": "",
+            "time_ms": run.get("time_ms"),
+            "cpu_ms": run.get("cpu_ms"),
+            "max_rss_kb": run.get("max_rss_kb"),
+            "truncated": bool(run.get("truncated"))
+        }
+
+        if run.get("skipped"):
+            entry["result"] = "✗ Не выполнялся (проверка остановлена досрочно)"
+        elif run["timed_out"]:
+            entry["result"] = "✗ Превышено время выполнения"
+        elif run.get("limit_exceeded") == "cpu":
+            entry["result"] = "✗ Превышен лимит процессорного времени"
+        elif run.get("limit_exceeded") == "memory":
+            entry["result"] = "✗ Превышен лимит памяти"
+        elif run.get("limit_exceeded") == "output":
+            entry["actual"] = run["stdout"].strip()
+            entry["result"] = f"✗ Превышен объем вывода ({SANDBOX_OUTPUT_LIMIT // 1024} КБ)"
+        elif run["returncode"] == 0:
+            actual_output = run["stdout"].strip()
+            entry["actual"] = actual_output
+
+            if actual_output == case["expected"]:
+                entry["passed"] = True
+                entry["result"] = "✓ Правильно"
+                tests_passed += 1
             else:
-                expected_output = ""
-                input_data = test_line.strip()
-
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-                temp_file.write(code)
-                temp_file_path = temp_file.name
-
-            try:
-                result = subprocess.run(
-                    ["python3", temp_file_path],
-                    input=input_data.replace(" ", "\n") if input_data else "",
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-
-                if result.returncode == 0:
-                    actual_output = result.stdout.strip()
-
-                    if actual_output == expected_output:
-                        test_results.append({
-                            "name": test_name,
-                            "passed": True,
-                            "test": test_line,
-                            "input": input_data if input_data else "(без ввода)",
-                            "expected": expected_output,
-                            "actual": actual_output,
-                            "result": "✓ Правильно"
-                        })
-                        tests_passed += 1
-                    else:
-                        test_results.append({
-                            "name": test_name,
-                            "passed": False,
-                            "test": test_line,
-                            "input": input_data if input_data else "(без ввода)",
-                            "expected": expected_output,
-                            "actual": actual_output,
-                            "result": f"✗ Неверно (ожидалось: {expected_output}, получено: {actual_output})"
-                        })
-                else:
-                    test_results.append({
-                        "name": test_name,
-                        "passed": False,
-                        "test": test_line,
-                        "input": input_data if input_data else "(без ввода)",
-                        "expected": expected_output,
-                        "actual": "",
-                        "result": f"✗ Ошибка выполнения: {result.stderr.strip()}"
-                    })
-
-                try:
-                    os.remove(temp_file_path)
-                except:
-                    pass
-
-            except subprocess.TimeoutExpired:
-                test_results.append({
-                    "name": test_name,
-                    "passed": False,
-                    "test": test_line,
-                    "input": input_data if input_data else "(без ввода)",
-                    "expected": expected_output,
-                    "actual": "",
-                    "result": "✗ Превышено время выполнения"
-                })
+                entry["result"] = f"✗ Неверно (ожидалось: {case['expected']}, получено: {actual_output})"
+        else:
+            entry["result"] = f"✗ Ошибка выполнения: {run['stderr'].strip()}"
 
-        except Exception as e:
-            test_results.append({
-                "name": test_name,
-                "passed": False,
-                "test": test_line,
-                "input": input_data if input_data else "(без ввода)",
-                "expected": expected_output,
-                "actual": "",
-                "result": f"Ошибка обработки теста: {str(e)}"
-            })
+        test_results.append(entry)
 
     return {
         "tests_passed": tests_passed,
-        "total_tests": len(test_lines),
+        "total_tests": len(test_cases),
         "test_results": json.dumps(test_results, ensure_ascii=False)
     }
 
-def normalize_ast(code):
+def run_tests(code, tests, stop_on_timeout: bool = TESTS_STOP_ON_TIMEOUT, max_failures: int = TESTS_MAX_FAILURES):
+    test_cases = parse_tests(tests)
     try:
-        tree = ast.parse(code)
-        return ast.dump(tree)
-    except:
-        return ""
+        runs = run_code(
+            code,
+            [_test_stdin(case) for case in test_cases],
+            timeout=RUN_TIMEOUT,
+            expected=[case["expected"] for case in test_cases],
+            stop_on_timeout=stop_on_timeout,
+            max_failures=max_failures
+        )
+    except Exception as e:
+        runs = [{"returncode": 1, "stdout": "", "stderr": f"Ошибка обработки теста: {str(e)}", "timed_out": False}
+                for _ in test_cases]
+    return build_test_results(test_cases, runs)
 
-def detect_plagiarism(db: Session, new_code: str, assignment_id: int, current_user_id: int):
-    solutions = db.query(models.Solution).filter(
+def _index_missing_fingerprints(db: Session, assignment_id: int):
+    """Считает отпечатки решений задания, у которых их нет или они устарели"""
+    outdated = db.query(models.Solution).filter(
         models.Solution.assignment_id == assignment_id,
-        models.Solution.user_id != current_user_id
+        (models.Solution.fingerprint_version == None) | (models.Solution.fingerprint_version != FINGERPRINT_VERSION)
     ).all()
 
-    if not solutions:
-        return {"is_plagiarism": False, "similarity": 0, "similar_users": []}
+    for solution in outdated:
+        crud.store_solution_fingerprint(db, solution)
+    if outdated:
+        db.commit()
+
+def detect_plagiarism(db: Session, new_code: str, assignment_id: int, current_user_id: int):
+    no_plagiarism = {"is_plagiarism": False, "similarity": 0, "similar_users": []}
+
+    new_fingerprints = fingerprint(new_code)
+    if not new_fingerprints:
+        return no_plagiarism
+
+    _index_missing_fingerprints(db, assignment_id)
+
+    # Кандидаты - решения с наибольшим числом общих отпечатков (из индекса)
+    fp = models.SolutionFingerprint
+    matches = func.count(fp.hash).label("matches")
+    candidates = db.query(fp.solution_id, matches).join(
+        models.Solution, models.Solution.id == fp.solution_id
+    ).filter(
+        fp.assignment_id == assignment_id,
+        fp.hash.in_(new_fingerprints),
+        models.Solution.user_id != current_user_id
+    ).group_by(fp.solution_id).order_by(matches.desc()).limit(PLAGIARISM_TOP_K).all()
+
+    min_matches = len(new_fingerprints) * PLAGIARISM_MIN_OVERLAP
+    candidate_ids = [solution_id for solution_id, count in candidates if count >= min_matches]
+    if not candidate_ids:
+        return no_plagiarism
+
+    # Точная оценка - только для лучших кандидатов
+    rows = db.query(models.Solution.normalized_ast, models.User.username).join(
+        models.User, models.User.id == models.Solution.user_id
+    ).filter(models.Solution.id.in_(candidate_ids)).all()
 
     new_ast = normalize_ast(new_code)
     max_similarity = 0
     similar_users = []
 
-    for solution in solutions:
-        existing_ast = normalize_ast(solution.code)
-
+    for existing_ast, username in rows:
         if new_ast and existing_ast:
             similarity = SequenceMatcher(None, new_ast, existing_ast).ratio()
 
             if similarity > 0.8:
                 max_similarity = max(max_similarity, similarity)
                 similar_users.append({
-                    "username": solution.user.username,
+                    "username": username,
                     "similarity": round(similarity * 100, 1)
                 })
 
@@ -223,4 +338,71 @@ def detect_plagiarism(db: Session, new_code: str, assignment_id: int, current_us
         "is_plagiarism": max_similarity > 0.8,
         "similarity": round(max_similarity * 100, 1),
         "similar_users": similar_users
-    }
\ No newline at end of file
+    }
+
+def plagiarism_clusters(db: Session, assignment_id: int, threshold: float = 0.6):
+    """Группы похожих решений задания (все со всеми, через MinHash/LSH).
+
+    Отчет кэшируется, пока не появится новое или обновленное решение.
+    """
+    # Версия набора решений: меняется при любой новой отправке
+    version = tuple(db.query(
+        func.count(models.Solution.id),
+        func.max(models.Solution.id),
+        func.max(models.Solution.last_modified)
+    ).filter(models.Solution.assignment_id == assignment_id).one())
+
+    key = (assignment_id, threshold)
+    with _clusters_cache_lock:
+        cached = _clusters_cache.get(key)
+        if cached:
+            _clusters_cache.move_to_end(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    _index_missing_fingerprints(db, assignment_id)
+
+    rows = db.query(
+        models.Solution.id,
+        models.Solution.fingerprint,
+        models.User.username,
+        models.User.first_name,
+        models.User.last_name
+    ).join(
+        models.User, models.User.id == models.Solution.user_id
+    ).filter(models.Solution.assignment_id == assignment_id).all()
+
+    students = {
+        row.id: {"solution_id": row.id, "username": row.username, "full_name": f"{row.last_name} {row.first_name}"}
+        for row in rows
+    }
+    clusters = cluster_fingerprints({row.id: decode_fingerprint(row.fingerprint) for row in rows}, threshold)
+
+    report = {
+        "assignment_id": assignment_id,
+        "solution_count": len(rows),
+        "threshold": threshold,
+        "clusters": sorted([
+            {
+                "size": len(ids),
+                "max_similarity": round(pairs[0][2] * 100, 1) if pairs else 0,
+                "members": [students[solution_id] for solution_id in ids],
+                "pairs": [
+                    {
+                        "first": students[a]["username"],
+                        "second": students[b]["username"],
+                        "similarity": round(similarity * 100, 1)
+                    }
+                    for a, b, similarity in pairs
+                ]
+            }
+            for ids, pairs in clusters
+        ], key=lambda cluster: (-cluster["max_similarity"], -cluster["size"]))
+    }
+
+    with _clusters_cache_lock:
+        _clusters_cache[key] = (version, report)
+        _clusters_cache.move_to_end(key)
+        while len(_clusters_cache) > CLUSTERS_CACHE_SIZE:
+            _clusters_cache.popitem(last=False)
+    return report